@@ -1,5 +1,56 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from recipes.counters import counters_changed
+        from recipes.images import image_processed
+        from recipes.models import (Ingredient, Recipe,
+                                    RecipeIngredientAmount, RecipeTag, Tag)
+        from users.models import User
+        from .authentication import (token_changed, user_changed,
+                                     user_counters_changed)
+        from .cache import (author_changed, author_saving,
+                            ingredient_changed, recipe_changed,
+                            recipe_counters_changed, recipe_image_processed,
+                            recipe_relation_changed, tag_changed)
+        from .ingredient_index import ingredient_index
+        from .pantry_index import pantry_index
+
+        for signal in (post_save, post_delete):
+            signal.connect(recipe_changed, sender=Recipe)
+            for model in (RecipeTag, RecipeIngredientAmount):
+                signal.connect(recipe_relation_changed, sender=model)
+            signal.connect(tag_changed, sender=Tag)
+            signal.connect(ingredient_changed, sender=Ingredient)
+            # После увеличения версии, чтобы проверка ее уже увидела.
+            signal.connect(
+                ingredient_index.ingredient_changed, sender=Ingredient)
+        # Готовые варианты изображения меняют ссылки в ответе.
+        image_processed.connect(recipe_image_processed, sender=Recipe)
+        # Счетчики меняются через update() без сигналов модели.
+        counters_changed.connect(recipe_counters_changed, sender=Recipe)
+        counters_changed.connect(user_counters_changed, sender=User)
+
+        # Рецепты удаленного пользователя удаляются каскадно и сами
+        # сбрасывают кеш, поэтому для пользователя важно только сохранение.
+        pre_save.connect(author_saving, sender=User)
+        post_save.connect(author_changed, sender=User)
+
+        # Ингредиенты рецепта сохраняются через bulk_create и bulk_update
+        # без сигналов, поэтому индекс обновляется и при сохранении рецепта.
+        post_save.connect(pantry_index.recipe_changed, sender=Recipe)
+        post_delete.connect(pantry_index.recipe_deleted, sender=Recipe)
+        for signal in (post_save, post_delete):
+            signal.connect(
+                pantry_index.recipe_ingredient_changed,
+                sender=RecipeIngredientAmount)
+
+        for signal in (post_save, post_delete):
+            signal.connect(user_changed, sender=User)
+            signal.connect(token_changed, sender=Token)
@@ -0,0 +1,225 @@
+"""ASGI-обертка над WSGI-приложением Django.
+
+Django 2.2 не умеет обрабатывать запросы асинхронно, поэтому асинхронной
+делается работа с клиентом: тело запроса читается и ответ отправляется
+в цикле событий, а Django (ORM, сериализация) выполняется в ограниченном
+пуле потоков. Медленный клиент занимает поток только на время обработки
+запроса, а не на время загрузки изображения или чтения ответа. Ответ
+передается клиенту по частям по мере готовности, а отключение клиента
+прерывает его формирование.
+Запросы на чтение рецептов, тегов, ингредиентов и подписок идут в
+отдельный пул, чтобы записи и загрузки изображений их не вытесняли.
+"""
+import asyncio
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+
+ASGI_READ_WORKERS = getattr(settings, 'ASGI_READ_WORKERS', 16)
+ASGI_WRITE_WORKERS = getattr(settings, 'ASGI_WRITE_WORKERS', 4)
+BODY_MEMORY_SIZE = getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440)
+# Сколько частей ответа может ждать отправки медленному клиенту, прежде
+# чем поток пула остановится до их отправки.
+RESPONSE_BUFFER_CHUNKS = 16
+READ_METHODS = ('GET', 'HEAD')
+READ_PATHS = re.compile(
+    r'^/api/(recipes/(\d+/)?|tags/.*|ingredients/.*|users/subscriptions/)$')
+
+
+class RequestAborted(Exception):
+    """Клиент отключился до окончания запроса."""
+
+
+class ASGIHandler:
+    """ASGI-приложение, выполняющее WSGI-приложение в пулах потоков."""
+
+    def __init__(self, wsgi_application, read_workers=ASGI_READ_WORKERS,
+                 write_workers=ASGI_WRITE_WORKERS):
+        self.wsgi_application = wsgi_application
+        self.read_executor = ThreadPoolExecutor(
+            max_workers=read_workers, thread_name_prefix='asgi-read')
+        self.write_executor = ThreadPoolExecutor(
+            max_workers=write_workers, thread_name_prefix='asgi-write')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(
+                f'Неподдерживаемый тип соединения {scope["type"]}')
+        try:
+            body = await self.read_body(receive)
+        except RequestAborted:
+            return
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=RESPONSE_BUFFER_CHUNKS)
+        aborted = threading.Event()
+        disconnected = loop.create_task(self.wait_disconnect(receive))
+        worker = loop.run_in_executor(
+            self.get_executor(scope), self.run_wsgi,
+            self.get_environ(scope, body), loop, queue, aborted)
+        try:
+            while True:
+                message = await self.next_message(
+                    queue, worker, disconnected)
+                if message is None:
+                    break
+                await send(message)
+            await send({'type': 'http.response.body', 'body': b''})
+        except RequestAborted:
+            pass
+        finally:
+            aborted.set()
+            disconnected.cancel()
+            await self.drain(queue, worker)
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.read_executor.shutdown(wait=False)
+                self.write_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_executor(self, scope):
+        if scope['method'] in READ_METHODS and READ_PATHS.match(
+                scope['path']):
+            return self.read_executor
+        return self.write_executor
+
+    async def read_body(self, receive):
+        """Читает тело запроса без участия потоков пула."""
+        body = SpooledTemporaryFile(max_size=BODY_MEMORY_SIZE, mode='w+b')
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise RequestAborted
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    async def wait_disconnect(self, receive):
+        """Ждет отключения клиента после чтения тела запроса."""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def next_message(self, queue, worker, disconnected):
+        """Следующее сообщение ответа или None, если ответ закончен."""
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait(
+            (getter, worker, disconnected),
+            return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            return getter.result()
+        getter.cancel()
+        if disconnected.done():
+            raise RequestAborted
+        # Поток кладет сообщения в очередь до своего завершения.
+        if not queue.empty():
+            return queue.get_nowait()
+        worker.result()
+        return None
+
+    async def drain(self, queue, worker):
+        """Освобождает очередь, пока поток пула не завершит ответ."""
+        while not worker.done():
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                (getter, worker), return_when=asyncio.FIRST_COMPLETED)
+            getter.cancel()
+        worker.exception()
+
+    def get_environ(self, scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode(
+                'utf-8').decode('latin1'),
+            # WSGI передает путь байтами UTF-8, прочитанными как latin-1.
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            if key in environ:
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                value = f'{environ[key]}{separator}{value}'
+            environ[key] = value
+        return environ
+
+    def run_wsgi(self, environ, loop, queue, aborted):
+        """Выполняет запрос в потоке пула и передает ответ по частям.
+
+        Тело ответа формируется в том же потоке, что и запрос, потому что
+        подключения к базе данных в Django привязаны к потоку. Каждая
+        часть отправляется клиенту, как только готова, поэтому потоковые
+        ответы не собираются в памяти. Если клиент отключился, запрос не
+        выполняется или перестает формировать ответ.
+        """
+        if aborted.is_set():
+            return
+        result = {}
+
+        def start_response(status, headers, exc_info=None):
+            result['status'] = int(status.split(' ', 1)[0])
+            result['headers'] = headers
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(
+                queue.put(message), loop).result()
+
+        def start_message():
+            return {
+                'type': 'http.response.start',
+                'status': result['status'],
+                'headers': [
+                    (name.lower().encode('latin1'), value.encode('latin1'))
+                    for name, value in result['headers']],
+            }
+
+        response = self.wsgi_application(environ, start_response)
+        started = False
+        try:
+            for chunk in response:
+                if aborted.is_set():
+                    return
+                if not chunk:
+                    continue
+                if not started:
+                    put(start_message())
+                    started = True
+                put({'type': 'http.response.body', 'body': chunk,
+                     'more_body': True})
+            if not started:
+                put(start_message())
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
@@ -0,0 +1,145 @@
+"""Аутентификация по токену с кешированием пользователя.
+
+Поля пользователя хранятся в ограниченном LRU-кеше процесса с TTL и,
+при TOKEN_CACHE_SHARED, в кеше Django, общем для процессов. Каждая
+запись помнит версию пользователя из кеша versions: выход, смена пароля,
+деактивация и любое сохранение пользователя увеличивают версию, поэтому
+устаревшие записи перестают приниматься сразу во всех процессах. Если
+кеш versions локальный для процесса, LRU-кеш не используется.
+Пароль в кеш не попадает и загружается из базы при обращении. Счетчики
+кешируются вместе с пользователем: их изменение тоже увеличивает версию,
+а save() счетчики не перезаписывает.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from users.models import User
+from .cache import VERSIONS_CACHE, bump_versions, get_version
+
+TOKEN_CACHE_SIZE = getattr(settings, 'TOKEN_CACHE_SIZE', 1024)
+TOKEN_CACHE_TTL = getattr(settings, 'TOKEN_CACHE_TTL', 60)
+TOKEN_CACHE_SHARED = getattr(settings, 'TOKEN_CACHE_SHARED', False)
+USER_VERSION = 'auth:user:{}:version'
+TOKEN_KEY = 'auth:token:{}'
+UNCACHED_FIELDS = ('password',)
+CACHED_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname not in UNCACHED_FIELDS)
+ID_INDEX = CACHED_FIELDS.index('id')
+
+
+class TokenCache:
+    """LRU-кеш токен -> (срок, версия пользователя, поля пользователя)."""
+
+    def __init__(self, size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1:]
+
+    def set(self, key, version, values):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, version, values)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard_user(self, user_id):
+        with self.lock:
+            for key in [key for key, (_, _, values) in self.entries.items()
+                        if values[ID_INDEX] == user_id]:
+                del self.entries[key]
+
+
+token_cache = TokenCache()
+
+
+def get_shared_key(key):
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def is_token_cache_enabled():
+    """Версии пользователей видны всем процессам, кешу можно доверять."""
+    return not isinstance(caches[VERSIONS_CACHE], LocMemCache)
+
+
+def invalidate_user(user_id):
+    """Сбрасывает закешированные токены пользователя."""
+    token_cache.discard_user(user_id)
+    bump_versions(USER_VERSION.format(user_id))
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def user_counters_changed(sender, field, pks, **kwargs):
+    for pk in pks:
+        invalidate_user(pk)
+
+
+def token_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе при попадании в кеш."""
+
+    def authenticate_credentials(self, key):
+        if not is_token_cache_enabled():
+            return super().authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is None and TOKEN_CACHE_SHARED:
+            cached = cache.get(get_shared_key(key))
+            if cached is not None:
+                token_cache.set(key, *cached)
+        if cached is not None:
+            version, values = cached
+            user_id = values[ID_INDEX]
+            if version == get_version(USER_VERSION.format(user_id)):
+                return self.get_credentials(key, values)
+        user_id = self.get_model().objects.filter(
+            key=key).values_list('user_id', flat=True).first()
+        if user_id is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        # Версия читается до пользователя: если он изменится между
+        # запросами, версия увеличится и запись не пройдет проверку.
+        version = get_version(USER_VERSION.format(user_id))
+        values = User.objects.filter(pk=user_id).values_list(
+            *CACHED_FIELDS).first()
+        if values is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        token_cache.set(key, version, values)
+        if TOKEN_CACHE_SHARED:
+            cache.set(get_shared_key(key), (version, values), TOKEN_CACHE_TTL)
+        return self.get_credentials(key, values)
+
+    def get_credentials(self, key, values):
+        user = User.from_db(DEFAULT_DB_ALIAS, CACHED_FIELDS, values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        token = self.get_model()(key=key, user=user)
+        token._state.adding = False
+        return user, token
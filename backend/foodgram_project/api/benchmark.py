@@ -0,0 +1,143 @@
+"""Нагрузочный прогон API внутри процесса.
+
+Запросы отправляются напрямую в WSGI-приложение из нескольких потоков,
+без сети и тестового клиента Django. Число SQL-запросов берется
+из заголовка Server-Timing, который выставляет ServerTimingMiddleware.
+"""
+import io
+import math
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+QUERY_COUNT_RE = re.compile(r'SQL \((\d+) queries\)')
+
+
+class Route:
+    """Маршрут для замера: имя, метод, url и токен пользователя."""
+
+    def __init__(self, name, url, method='GET', token=None, body=b'',
+                 content_type='application/json'):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.token = token
+        self.body = body
+        self.content_type = content_type
+
+    def get_environ(self, host):
+        url = urlsplit(self.url)
+        environ = {
+            'REQUEST_METHOD': self.method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': host,
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': self.content_type,
+            'CONTENT_LENGTH': str(len(self.body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(self.body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if self.token:
+            environ['HTTP_AUTHORIZATION'] = f'Token {self.token}'
+        return environ
+
+    def get_scope(self, host):
+        url = urlsplit(self.url)
+        headers = [
+            (b'host', host.encode()),
+            (b'content-type', self.content_type.encode()),
+            (b'content-length', str(len(self.body)).encode())]
+        if self.token:
+            headers.append(
+                (b'authorization', f'Token {self.token}'.encode()))
+        return {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': self.method,
+            'scheme': 'http',
+            'path': url.path,
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': (host, 80),
+        }
+
+
+def call_wsgi(application, environ):
+    """Выполняет запрос и возвращает статус и заголовки ответа."""
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split(' ', 1)[0])
+        result['headers'] = dict(headers)
+
+    body = application(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return result['status'], result['headers']
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def summarize(durations, query_counts, statuses, elapsed):
+    durations = sorted(durations)
+    return {
+        'requests': len(durations),
+        'rps': round(len(durations) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3),
+        'p50_ms': round(percentile(durations, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+        'max_ms': round(durations[-1] * 1000, 3),
+        'queries_per_request': round(
+            sum(query_counts) / len(query_counts), 2)
+        if query_counts else None,
+        'statuses': {
+            str(status): count for status, count in sorted(
+                Counter(statuses).items())},
+    }
+
+
+def run_route(application, route, requests, threads, host='localhost',
+              warmup=1):
+    """Выполняет requests запросов в threads потоков и сводит замеры."""
+    for _ in range(warmup):
+        call_wsgi(application, route.get_environ(host))
+
+    def measure(_):
+        environ = route.get_environ(host)
+        started = time.perf_counter()
+        status, headers = call_wsgi(application, environ)
+        duration = time.perf_counter() - started
+        match = QUERY_COUNT_RE.search(headers.get('Server-Timing', ''))
+        return duration, int(match.group(1)) if match else None, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(measure, range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize(
+        [duration for duration, _, _ in results],
+        [queries for _, queries, _ in results if queries is not None],
+        [status for _, _, status in results], elapsed)
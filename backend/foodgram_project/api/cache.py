@@ -0,0 +1,145 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+
+from recipes.models import Tag
+from .db_router import use_primary
+
+RECIPE_CACHE_TIMEOUT = getattr(settings, 'RECIPE_CACHE_TIMEOUT', 60 * 10)
+CATALOG_CACHE_MAX_AGE = getattr(settings, 'CATALOG_CACHE_MAX_AGE', 60)
+
+RECIPES_VERSION = 'recipes:version'
+RELATED_VERSION = 'recipes:related:version'
+RECIPE_VERSION = 'recipe:{}:version'
+TAGS_VERSION = 'tags:version'
+INGREDIENTS_VERSION = 'ingredients:version'
+PANTRY_VERSION = 'pantry:version'
+
+VERSIONS_CACHE = 'versions'
+
+# Счетчики рецепта, которые входят в кешируемые ответы.
+CACHED_RECIPE_COUNTERS = ('favorites_count',)
+
+# Поля автора, которые отдаются вместе с рецептами.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def get_version(key):
+    """Возвращает текущую версию, при отсутствии заводит новую.
+
+    Версии хранятся в общем для всех процессов кеше versions. Начальное
+    значение берется из времени, чтобы после вытеснения ключа из кеша
+    версия не совпала с одной из старых.
+    """
+    versions = caches[VERSIONS_CACHE]
+    version = versions.get(key)
+    if version is None:
+        versions.add(key, time.time_ns(), timeout=None)
+        version = versions.get(key)
+    return version
+
+
+def bump_version(key):
+    """Увеличивает версию и возвращает новое значение."""
+    versions = caches[VERSIONS_CACHE]
+    try:
+        return versions.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        versions.set(key, version, timeout=None)
+        return version
+
+
+def bump_versions(*keys):
+    """Увеличивает версии после фиксации текущей транзакции."""
+    def bump():
+        for key in keys:
+            bump_version(key)
+    transaction.on_commit(bump)
+
+
+def get_tag_map():
+    """Словарь slug -> id всех тегов, кешируется до изменения тегов."""
+    key = 'tags:map:{}'.format(get_version(TAGS_VERSION))
+    tag_map = cache.get(key)
+    if tag_map is None:
+        with use_primary():
+            tag_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_map, None)
+    return tag_map
+
+
+def get_params_hash(request):
+    params = sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists())
+    return hashlib.md5(
+        repr((request.scheme, request.get_host(), params)).encode()
+    ).hexdigest()
+
+
+def get_recipe_list_key(request):
+    return 'recipes:list:{}:{}:{}'.format(
+        get_version(RECIPES_VERSION), get_version(RELATED_VERSION),
+        get_params_hash(request))
+
+
+def get_recipe_detail_key(request, pk):
+    return 'recipes:detail:{}:{}:{}:{}'.format(
+        pk, get_version(RECIPE_VERSION.format(pk)),
+        get_version(RELATED_VERSION), get_params_hash(request))
+
+
+def recipe_changed(sender, instance, **kwargs):
+    bump_versions(RECIPES_VERSION, RECIPE_VERSION.format(instance.pk))
+
+
+def recipe_image_processed(sender, recipe_id, **kwargs):
+    bump_versions(RECIPES_VERSION, RECIPE_VERSION.format(recipe_id))
+
+
+def recipe_counters_changed(sender, field, pks, **kwargs):
+    if field in CACHED_RECIPE_COUNTERS:
+        bump_versions(RECIPES_VERSION, *(
+            RECIPE_VERSION.format(pk) for pk in pks))
+
+
+def recipe_relation_changed(sender, instance, **kwargs):
+    bump_versions(
+        RECIPES_VERSION, RECIPE_VERSION.format(instance.recipe_id))
+
+
+def author_saving(sender, instance, update_fields=None, **kwargs):
+    """Проверяет, меняет ли сохранение поля автора, видимые в рецептах.
+
+    Вход, смена пароля и регистрация не затрагивают эти поля, поэтому
+    кеш рецептов сбрасывается только при реальном изменении данных
+    пользователя, у которого есть рецепты.
+    """
+    instance._author_changed = False
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(AUTHOR_FIELDS) & set(
+            update_fields):
+        return
+    saved = sender.objects.filter(
+        pk=instance.pk, recipes__isnull=False).values_list(
+            *AUTHOR_FIELDS).first()
+    instance._author_changed = saved is not None and saved != tuple(
+        getattr(instance, field) for field in AUTHOR_FIELDS)
+
+
+def author_changed(sender, instance, **kwargs):
+    if getattr(instance, '_author_changed', False):
+        bump_versions(RELATED_VERSION)
+
+
+def tag_changed(sender, instance, **kwargs):
+    bump_versions(TAGS_VERSION, RELATED_VERSION)
+
+
+def ingredient_changed(sender, instance, **kwargs):
+    bump_versions(INGREDIENTS_VERSION, RELATED_VERSION)
@@ -0,0 +1,85 @@
+"""Чтение из реплик базы данных с привязкой к основной после записи.
+
+Реплика выбирается только для безопасных запросов к вьюсетам
+с ReplicaReadMixin. Если пользователь недавно что-то записал,
+его запросы на чтение REPLICA_STICKY_SECONDS секунд идут в основную
+базу, чтобы он сразу видел свои изменения несмотря на отставание реплик.
+Отметка о записи хранится в кеше versions, общем для всех воркеров:
+следующий запрос пользователя может попасть в другой процесс.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DATABASES = getattr(settings, 'REPLICA_DATABASES', [])
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+REPLICA_STICKY_CACHE = getattr(settings, 'REPLICA_STICKY_CACHE', 'versions')
+STICKY_KEY = 'db:sticky:{}'
+
+read_database = contextvars.ContextVar('read_database', default=None)
+primary_written = contextvars.ContextVar('primary_written', default=False)
+
+
+def get_read_database(user):
+    """Реплика для чтения или None, если читать нужно из основной базы."""
+    if not REPLICA_DATABASES:
+        return None
+    if user.is_authenticated and caches[REPLICA_STICKY_CACHE].get(
+            STICKY_KEY.format(user.pk)):
+        return None
+    return random.choice(REPLICA_DATABASES)
+
+
+@contextmanager
+def use_primary():
+    """Чтение из основной базы, например при заполнении кеша по версии:
+    отставшая реплика сохранила бы в нем устаревшие данные."""
+    token = read_database.set(None)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class ReplicaRouter:
+    """Запись в основную базу, чтение из выбранной для запроса реплики."""
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        primary_written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaStickinessMiddleware:
+    """Запоминает пользователей, которые записали что-то в основную базу."""
+
+    def __init__(self, get_response):
+        if not REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = primary_written.set(False)
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if (primary_written.get() and user is not None and
+                    user.is_authenticated):
+                caches[REPLICA_STICKY_CACHE].set(
+                    STICKY_KEY.format(user.pk), True, REPLICA_STICKY_SECONDS)
+        finally:
+            primary_written.reset(token)
+        return response
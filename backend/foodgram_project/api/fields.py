@@ -1,8 +1,11 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from recipes.images import IMAGE_FORMATS, IMAGE_VARIANTS, get_variant_name
+
 
 class Base64ImageField(serializers.ImageField):
     """Кастомное поле сериализатора для обработки данных в формате base64."""
@@ -13,3 +16,33 @@ class Base64ImageField(serializers.ImageField):
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
         return super().to_internal_value(data)
+
+
+class ImageVariantsField(serializers.Field):
+    """Поле со ссылками на уменьшенные варианты изображения рецепта.
+
+    Пока варианты не готовы, все ссылки указывают на исходный файл.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        request = self.context.get('request')
+        ready = recipe.processed_image == recipe.image.name
+        variants = {}
+        for variant in IMAGE_VARIANTS:
+            variants[variant] = {}
+            for image_format in IMAGE_FORMATS:
+                url = recipe.image.url
+                if ready:
+                    url = default_storage.url(get_variant_name(
+                        recipe.image.name, variant, image_format))
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[variant][image_format] = url
+        return variants
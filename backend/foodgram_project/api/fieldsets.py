@@ -0,0 +1,86 @@
+"""Выборочные поля ответа: параметры ?fields= и ?omit=.
+
+Поля перечисляются через запятую, поля вложенных объектов задаются через
+точку: ?fields=id,name,author.username или ?omit=text,author.is_subscribed.
+Параметры учитываются только в безопасных запросах.
+"""
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_fields(value):
+    """Разбирает строку 'a,b.c' в дерево {'a': {}, 'b': {'c': {}}}."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.split('.'):
+            name = name.strip()
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSet:
+    """Набор полей, которые нужно отдать в ответе.
+
+    include равен None, если запрошены все поля. Пустое поддерево
+    в include означает вложенный объект целиком, а в omit — пропуск
+    поля целиком.
+    """
+
+    def __init__(self, include=None, omit=None):
+        self.include = include
+        self.omit = omit or {}
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        return cls(
+            parse_fields(request.query_params.get(FIELDS_PARAM, '')) or None,
+            parse_fields(request.query_params.get(OMIT_PARAM, '')))
+
+    def __contains__(self, name):
+        if self.omit.get(name) == {}:
+            return False
+        return self.include is None or name in self.include
+
+    def nested(self, name):
+        """Набор полей вложенного объекта name."""
+        include = None if self.include is None else self.include.get(name)
+        return FieldSet(include or None, self.omit.get(name))
+
+
+class SparseFieldsMixin:
+    """Оставляет в сериализаторе только запрошенные поля.
+
+    Сериализатор верхнего уровня берет набор полей из запроса, вложенным
+    сериализаторам с этим миксином набор передает родитель.
+    """
+
+    fieldset = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.get_fieldset()
+        for name in list(fields):
+            if name not in fieldset:
+                del fields[name]
+                continue
+            field = getattr(fields[name], 'child', fields[name])
+            if isinstance(field, SparseFieldsMixin):
+                field.fieldset = fieldset.nested(name)
+        return fields
+
+    def get_fieldset(self):
+        if self.fieldset is not None:
+            return self.fieldset
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        if parent is None:
+            return FieldSet.from_request(self.context.get('request'))
+        return FieldSet()
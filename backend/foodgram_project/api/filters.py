@@ -1,23 +1,40 @@
+from django.db.models import Exists, OuterRef
 from django_filters import FilterSet
-from django_filters.rest_framework import (AllValuesMultipleFilter,
-                                           BooleanFilter, CharFilter)
-from rest_framework.filters import SearchFilter
+from django_filters.rest_framework import (BooleanFilter, CharFilter,
+                                           MultipleChoiceFilter)
 
-from recipes.models import Recipe
+from recipes.models import Recipe, RecipeTag
+from recipes.search import search_recipes
+from .cache import get_tag_map
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_map()]
 
 
 class RecipeFilter(FilterSet):
     """Кастомный фильтр для модели рецептов."""
 
     author = CharFilter(field_name='author__id')
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleChoiceFilter(
+        choices=get_tag_choices, method='get_tags')
     is_favorited = BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='get_is_in_shopping_cart')
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
         fields = ['author', 'tags', 'is_favorited']
 
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_map = get_tag_map()
+        return queryset.annotate(has_tags=Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tag_map[slug] for slug in value]))).filter(
+                has_tags=True)
+
     def get_is_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(favorite_recipes__user=self.request.user)
@@ -28,8 +45,7 @@ class RecipeFilter(FilterSet):
             return queryset.filter(in_shopping_carts__user=self.request.user)
         return queryset
 
-
-class IngredientSearchFilter(SearchFilter):
-    """Кастомный фильтр для поиска по модели ингредиентов."""
-
-    search_param = 'name'
+    def get_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
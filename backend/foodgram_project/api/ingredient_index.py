@@ -0,0 +1,205 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import Ingredient
+from .cache import INGREDIENTS_VERSION, get_version
+from .db_router import use_primary
+
+INGREDIENT_SEARCH_LIMIT = getattr(settings, 'INGREDIENT_SEARCH_LIMIT', 20)
+INGREDIENT_INDEX_TTL = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+
+GRAM_SIZE = 3
+TYPO_MIN_LENGTH = 4
+TYPO_CANDIDATES = 50
+
+
+def get_typo_limit(token):
+    """Допустимое число опечаток в слове запроса."""
+    if len(token) < TYPO_MIN_LENGTH:
+        return 0
+    return 1 if len(token) <= 6 else 2
+
+
+def normalize(value):
+    return value.strip().lower().replace('ё', 'е')
+
+
+def get_grams(value):
+    return {value[i:i + GRAM_SIZE]
+            for i in range(len(value) - GRAM_SIZE + 1)}
+
+
+def bounded_distance(first, second, limit):
+    """Расстояние Левенштейна в полосе шириной limit вокруг диагонали.
+
+    Если расстояние больше limit, возвращается limit + 1.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(second) + 1)]
+    for i, first_char in enumerate(first, 1):
+        current = [i if i <= limit else over] + [over] * len(second)
+        for j in range(max(1, i - limit), min(len(second), i + limit) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second[j - 1]),
+                over)
+        if min(current) > limit:
+            return over
+        previous = current
+    return previous[-1]
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для ранжированного поиска.
+
+    Сначала возвращаются совпадения по началу названия, затем по подстроке,
+    затем названия с небольшой опечаткой.
+    """
+
+    def __init__(self, ingredients):
+        self.items = sorted(
+            ({'id': pk, 'name': name, 'measurement_unit': unit}
+             for pk, name, unit in ingredients),
+            key=lambda item: (normalize(item['name']), item['id']))
+        self.keys = [normalize(item['name']) for item in self.items]
+        self.grams = defaultdict(list)
+        for position, key in enumerate(self.keys):
+            for gram in get_grams(key):
+                self.grams[gram].append(position)
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        query = normalize(query)
+        if not query:
+            return self.items[:limit]
+        found = self.prefix_matches(query, limit)
+        if len(found) < limit:
+            found += self.substring_matches(query, set(found))
+        if len(found) < limit and len(query) >= TYPO_MIN_LENGTH:
+            found += self.typo_matches(query, set(found))
+        return [self.items[position] for position in found[:limit]]
+
+    def prefix_matches(self, query, limit):
+        found = []
+        position = bisect_left(self.keys, query)
+        while (len(found) < limit and position < len(self.keys) and
+               self.keys[position].startswith(query)):
+            found.append(position)
+            position += 1
+        return found
+
+    def candidates(self, query):
+        grams = get_grams(query)
+        if not grams:
+            return range(len(self.keys))
+        postings = sorted(
+            (self.grams.get(gram, ()) for gram in grams), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+        return result
+
+    def substring_matches(self, query, exclude):
+        matches = []
+        for position in self.candidates(query):
+            if position in exclude:
+                continue
+            offset = self.keys[position].find(query)
+            if offset > 0:
+                matches.append(
+                    (offset, len(self.keys[position]), position))
+        return [position for *_, position in sorted(matches)]
+
+    def typo_matches(self, query, exclude):
+        """Названия с небольшими опечатками.
+
+        Каждое слово запроса сравнивается с началом каждого слова названия,
+        так что слова могут идти в любом порядке.
+        """
+        tokens = query.split()
+        limits = [get_typo_limit(token) for token in tokens]
+        grams = set().union(*map(get_grams, tokens))
+        shared = defaultdict(int)
+        for gram in grams:
+            for position in self.grams.get(gram, ()):
+                shared[position] += 1
+        min_shared = max(1, len(grams) - GRAM_SIZE * sum(limits))
+        candidates = nlargest(
+            TYPO_CANDIDATES,
+            (position for position, count in shared.items()
+             if count >= min_shared and position not in exclude),
+            key=shared.__getitem__)
+        matches = []
+        for position in candidates:
+            key = self.keys[position]
+            words = key.split()
+            total = 0
+            for token, limit in zip(tokens, limits):
+                distance = min(
+                    bounded_distance(token, word[:len(token)], limit)
+                    for word in words)
+                if distance > limit:
+                    break
+                total += distance
+            else:
+                matches.append((total, len(key), position))
+        return [position for *_, position in sorted(matches)]
+
+
+class IngredientIndexHolder:
+    """Ленивая сборка индекса и его пересборка при изменении ингредиентов.
+
+    Версия таблицы ингредиентов в общем кеше проверяется не чаще, чем раз
+    в INGREDIENT_INDEX_TTL секунд; индекс пересобирается, только если она
+    изменилась. Изменения из этого процесса сбрасывают срок сразу после
+    фиксации транзакции.
+    """
+
+    def __init__(self, ttl=INGREDIENT_INDEX_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.checked_at = None
+
+    def is_fresh(self):
+        return (self.checked_at is not None and
+                time.monotonic() - self.checked_at < self.ttl)
+
+    def get(self):
+        if self.is_fresh():
+            return self.index
+        with self.lock:
+            if not self.is_fresh():
+                version = get_version(INGREDIENTS_VERSION)
+                if self.index is None or version != self.version:
+                    with use_primary():
+                        self.index = IngredientIndex(
+                            Ingredient.objects.values_list(
+                                'id', 'name', 'measurement_unit'))
+                    self.version = version
+                self.checked_at = time.monotonic()
+            return self.index
+
+    def expire(self):
+        self.checked_at = None
+
+    def ingredient_changed(self, sender, instance, **kwargs):
+        transaction.on_commit(self.expire)
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        return self.get().search(query, limit)
+
+
+ingredient_index = IngredientIndexHolder()
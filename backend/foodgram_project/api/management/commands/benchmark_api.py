@@ -0,0 +1,121 @@
+import json
+import time
+from urllib.parse import quote
+
+from django.core.management import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from api.benchmark import Route, run_route
+from recipes.models import Ingredient, Recipe, RecipeIngredientAmount, Tag
+from users.models import User
+
+
+def get_routes():
+    """Маршруты API с параметрами из текущих данных базы."""
+    user = User.objects.filter(
+        shopping_cart__isnull=False, followings__isnull=False).first()
+    recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+    if user is None or recipe is None:
+        raise CommandError(
+            'Нет данных для замера, запустите seed_benchmark_data')
+    token = Token.objects.get_or_create(user=user)[0].key
+    slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+    ingredient_name = Ingredient.objects.values_list(
+        'name', flat=True).first()
+    ingredient_ids = ','.join(map(str, RecipeIngredientAmount.objects.filter(
+        recipe=recipe).values_list('ingredient_id', flat=True)))
+    search = quote(recipe.name.split()[0])
+    tags = '&'.join(f'tags={slug}' for slug in slugs)
+    return [
+        Route('tags', '/api/tags/'),
+        Route('ingredients_search',
+              f'/api/ingredients/?name={quote(ingredient_name[:3])}'),
+        Route('recipes_list_anonymous', '/api/recipes/?limit=6'),
+        Route('recipes_list', '/api/recipes/?limit=6', token=token),
+        Route('recipes_list_cursor',
+              '/api/recipes/?limit=6&pagination=cursor', token=token),
+        Route('recipes_by_tags', f'/api/recipes/?limit=6&{tags}',
+              token=token),
+        Route('recipes_search', f'/api/recipes/?limit=6&search={search}',
+              token=token),
+        Route('recipe_detail', f'/api/recipes/{recipe.id}/', token=token),
+        Route('recipe_similar', f'/api/recipes/{recipe.id}/similar/'),
+        Route('pantry', f'/api/recipes/pantry/?ingredients={ingredient_ids}'),
+        Route('feed', '/api/recipes/feed/?limit=6', token=token),
+        Route('subscriptions',
+              '/api/users/subscriptions/?limit=6&recipes_limit=3',
+              token=token),
+        Route('download_shopping_cart',
+              '/api/recipes/download_shopping_cart/', token=token),
+        Route('users_me', '/api/users/me/', token=token),
+    ]
+
+
+class Command(BaseCommand):
+    """Команда для замера задержек API под параллельной нагрузкой.
+
+    Печатает p50/p95/p99 и число SQL-запросов по маршрутам и сохраняет
+    результат в json для сравнения прогонов (параметр --compare).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на маршрут')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--routes', nargs='*',
+                            help='Замерять только указанные маршруты')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--output', help='Файл для результатов')
+        parser.add_argument('--compare', help='Результаты прошлого прогона')
+
+    def handle(self, *args, **options):
+        routes = get_routes()
+        if options['routes']:
+            routes = [
+                route for route in routes if route.name in options['routes']]
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['routes']
+        application = get_wsgi_application()
+        results = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'database': connection.vendor,
+            'recipes': Recipe.objects.count(),
+            'users': User.objects.count(),
+            'threads': options['threads'],
+            'requests': options['requests'],
+            'routes': {},
+        }
+        self.stdout.write(
+            f'{"маршрут":<26}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"rps":>9}{"SQL":>7}  статусы')
+        for route in routes:
+            summary = run_route(
+                application, route, options['requests'],
+                options['threads'], options['host'], options['warmup'])
+            results['routes'][route.name] = summary
+            self.write_summary(route.name, summary, previous.get(route.name))
+        output = options['output'] or time.strftime(
+            'benchmark-%Y%m%d-%H%M%S.json')
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        self.stdout.write(
+            self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+    def write_summary(self, name, summary, previous):
+        queries = summary['queries_per_request']
+        self.stdout.write(
+            f'{name:<26}{summary["p50_ms"]:>9.2f}{summary["p95_ms"]:>9.2f}'
+            f'{summary["p99_ms"]:>9.2f}{summary["rps"]:>9.1f}'
+            f'{"-" if queries is None else queries:>7}  '
+            f'{summary["statuses"]}')
+        if previous:
+            self.stdout.write(
+                f'{"":<26}' + ''.join(
+                    f'{summary[key] / previous[key] - 1:>+9.0%}'
+                    if previous.get(key) else f'{"":>9}'
+                    for key in ('p50_ms', 'p95_ms', 'p99_ms')))
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+import time
+
+from django.core.management import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+from api.asgi import READ_METHODS, READ_PATHS, ASGIHandler
+from api.benchmark import QUERY_COUNT_RE, call_wsgi, summarize
+from api.management.commands.benchmark_api import get_routes
+
+
+class Command(BaseCommand):
+    """Команда для сравнения ASGI и WSGI под медленными клиентами.
+
+    Каждый клиент медленно отправляет запрос и медленно читает ответ.
+    В режиме WSGI синхронный воркер занят все это время, поэтому число
+    одновременно обслуживаемых клиентов равно числу воркеров. В режиме
+    ASGI то же число потоков занято только обработкой запроса в Django.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=5,
+                            help='Запросов на клиента')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Воркеров WSGI и потоков пула ASGI')
+        parser.add_argument('--upload-delay', type=float, default=0.05,
+                            help='Время отправки запроса клиентом, с')
+        parser.add_argument('--download-delay', type=float, default=0.1,
+                            help='Время чтения ответа клиентом, с')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--output', help='Файл для результатов')
+
+    def handle(self, *args, **options):
+        routes = [
+            route for route in get_routes()
+            if route.method in READ_METHODS and READ_PATHS.match(
+                route.url.split('?')[0])]
+        results = {'options': {
+            key: options[key] for key in (
+                'clients', 'requests', 'workers', 'upload_delay',
+                'download_delay')}}
+        self.stdout.write(
+            f'Маршруты: {", ".join(route.name for route in routes)}')
+        for mode, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+            started = time.perf_counter()
+            measurements = run(routes, options)
+            summary = summarize(
+                [duration for duration, _, _ in measurements],
+                [queries for _, queries, _ in measurements
+                 if queries is not None],
+                [status for _, _, status in measurements],
+                time.perf_counter() - started)
+            results[mode] = summary
+            self.stdout.write(
+                f'{mode}: {summary["rps"]} запросов/с, '
+                f'p50 {summary["p50_ms"]:.0f} мс, '
+                f'p95 {summary["p95_ms"]:.0f} мс, '
+                f'p99 {summary["p99_ms"]:.0f} мс, '
+                f'статусы {summary["statuses"]}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def get_plan(self, routes, options):
+        """Последовательность маршрутов для каждого клиента."""
+        return [
+            [routes[(client + number) % len(routes)]
+             for number in range(options['requests'])]
+            for client in range(options['clients'])]
+
+    def run_wsgi(self, routes, options):
+        """Синхронные воркеры: воркер занят и во время обмена с клиентом."""
+        application = get_wsgi_application()
+        workers = threading.BoundedSemaphore(options['workers'])
+        measurements = []
+        lock = threading.Lock()
+
+        def client(plan):
+            for route in plan:
+                started = time.perf_counter()
+                with workers:
+                    time.sleep(options['upload_delay'])
+                    status, headers = call_wsgi(
+                        application, route.get_environ(options['host']))
+                    time.sleep(options['download_delay'])
+                match = QUERY_COUNT_RE.search(
+                    headers.get('Server-Timing', ''))
+                with lock:
+                    measurements.append((
+                        time.perf_counter() - started,
+                        int(match.group(1)) if match else None, status))
+
+        threads = [
+            threading.Thread(target=client, args=(plan,))
+            for plan in self.get_plan(routes, options)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return measurements
+
+    def run_asgi(self, routes, options):
+        application = ASGIHandler(
+            get_wsgi_application(), read_workers=options['workers'],
+            write_workers=options['workers'])
+
+        async def request(route):
+            sent = False
+            response = {}
+
+            async def receive():
+                nonlocal sent
+                if sent:
+                    await asyncio.Event().wait()
+                sent = True
+                await asyncio.sleep(options['upload_delay'])
+                return {'type': 'http.request', 'body': route.body}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    response['status'] = message['status']
+                    response['headers'] = {
+                        name.decode(): value.decode()
+                        for name, value in message['headers']}
+                elif not message.get('more_body'):
+                    await asyncio.sleep(options['download_delay'])
+
+            started = time.perf_counter()
+            await application(route.get_scope(options['host']), receive, send)
+            match = QUERY_COUNT_RE.search(
+                response['headers'].get('server-timing', ''))
+            return (time.perf_counter() - started,
+                    int(match.group(1)) if match else None,
+                    response['status'])
+
+        async def client(plan):
+            return [await request(route) for route in plan]
+
+        async def main():
+            results = await asyncio.gather(*(
+                client(plan) for plan in self.get_plan(routes, options)))
+            return [measurement for plan in results
+                    for measurement in plan]
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(main())
+        finally:
+            loop.close()
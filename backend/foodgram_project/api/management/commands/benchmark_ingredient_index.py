@@ -0,0 +1,25 @@
+from timeit import Timer
+
+from django.core.management import BaseCommand
+
+from api.ingredient_index import ingredient_index
+
+QUERIES = ('с', 'сах', 'сахар', 'молоко', 'сыр', 'мука пшеничная',
+           'ябл', 'малако', 'картофель', 'перец черный')
+
+
+class Command(BaseCommand):
+    """Команда для замера скорости поиска по индексу ингредиентов."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        index = ingredient_index.get()
+        self.stdout.write(f'Ингредиентов в индексе: {len(index)}')
+        for query in QUERIES:
+            seconds = Timer(lambda: index.search(query)).timeit(
+                options['repeat'])
+            self.stdout.write(
+                f'{query!r}: {seconds / options["repeat"] * 1e6:.1f} мкс, '
+                f'найдено {len(index.search(query))}')
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from timeit import Timer
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeReadSerializer
+from api.views import RecipeViewSet
+
+SAMPLE = {
+    'name': 'Борщ с «пампушками» ',
+    'created': datetime(2021, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'amount': Decimal('12.50'),
+    'ratio': 0.1,
+    'empty': None,
+}
+
+
+class Command(BaseCommand):
+    """Команда для сравнения JSONRenderer с версией на orjson.
+
+    Проверяет, что ответы с рецептами сериализуются байт в байт так же,
+    и печатает время рендеринга.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson не установлен')
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        view = RecipeViewSet(request=request, action='list', format_kwarg=None)
+        recipes = view.get_queryset().order_by('-pub_date')[
+            :options['recipes']]
+        data = RecipeReadSerializer(
+            recipes, many=True, context={'request': request}).data
+        if not data:
+            raise CommandError(
+                'Нет данных для замера, запустите seed_benchmark_data')
+        for payload in (data, SAMPLE):
+            expected = JSONRenderer().render(payload)
+            if FastJSONRenderer().render(payload) != expected:
+                raise CommandError('Результат рендеринга отличается')
+        body = JSONRenderer().render(data)
+        self.stdout.write(
+            f'Рецептов: {len(data)}, размер ответа: {len(body)} байт')
+        repeat = options['repeat']
+        standard_time = Timer(
+            lambda: JSONRenderer().render(data)).timeit(repeat) / repeat
+        fast_time = Timer(
+            lambda: FastJSONRenderer().render(data)).timeit(repeat) / repeat
+        self.stdout.write(
+            f'render: json {standard_time * 1e6:.0f} мкс, '
+            f'orjson {fast_time * 1e6:.0f} мкс, '
+            f'ускорение x{standard_time / fast_time:.1f}')
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management import BaseCommand
+
+from api.benchmark import percentile
+from api.pantry_index import PantryIndex
+
+
+def generate_rows(recipes, ingredients, seed):
+    """Пары (recipe_id, ingredient_id) со скошенной частотой ингредиентов.
+
+    Частота ингредиента убывает по закону Ципфа: соль и сахар есть
+    в большой доле рецептов, редкие ингредиенты — в единицах.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, ingredients + 1) ** 1.1
+    sizes = rng.integers(4, 14, recipes)
+    recipe_ids = np.repeat(np.arange(1, recipes + 1), sizes)
+    ingredient_ids = rng.choice(
+        np.arange(1, ingredients + 1), size=len(recipe_ids),
+        p=weights / weights.sum())
+    return zip(recipe_ids.tolist(), ingredient_ids.tolist())
+
+
+class Command(BaseCommand):
+    """Команда для замера подбора рецептов по ингредиентам.
+
+    Индекс строится на синтетических данных без базы: частые ингредиенты
+    входят в большую долю рецептов, как в реальном каталоге.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--sizes', type=int, nargs='*', default=[10, 30],
+                            help='Число ингредиентов в запросе')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+        index = PantryIndex.from_rows(generate_rows(
+            options['recipes'], options['ingredients'], options['seed']))
+        self.stdout.write(
+            f'Рецептов: {len(index)}, связей: {index.postings.nnz}, '
+            f'сборка {time.perf_counter() - started_at:.2f} с')
+        rng = np.random.default_rng(options['seed'])
+        weights = 1 / np.arange(1, options['ingredients'] + 1) ** 1.1
+        for size in options['sizes']:
+            queries = [
+                rng.choice(np.arange(1, options['ingredients'] + 1),
+                           size=size, replace=False,
+                           p=weights / weights.sum()).tolist()
+                for _ in range(options['requests'])]
+            timings = []
+            for query in queries:
+                started_at = time.perf_counter()
+                index.search(query)
+                timings.append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as executor:
+                list(executor.map(index.search, queries))
+            throughput = len(queries) / (time.perf_counter() - started_at)
+            timings.sort()
+            self.stdout.write(
+                f'{size} ингредиентов: p50 '
+                f'{percentile(timings, 0.5) * 1e3:.2f} мс, p95 '
+                f'{percentile(timings, 0.95) * 1e3:.2f} мс, '
+                f'{throughput:.0f} запросов/с в {options["threads"]} потоков')
+        started_at = time.perf_counter()
+        updates = 100
+        for recipe_id in range(1, updates + 1):
+            index = index.update_recipe(recipe_id, [1, 2, 3])
+        self.stdout.write(
+            'Изменение рецепта: '
+            f'{(time.perf_counter() - started_at) / updates * 1e3:.2f} мс')
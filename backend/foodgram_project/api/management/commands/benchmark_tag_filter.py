@@ -0,0 +1,51 @@
+from timeit import Timer
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.datastructures import MultiValueDict
+
+from api.filters import RecipeFilter
+from recipes.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    """Команда для замера фильтрации рецептов по нескольким тегам.
+
+    Сравнивает фильтр RecipeFilter (EXISTS) с прежним вариантом через
+    JOIN по тегам и DISTINCT.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, default=3)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        slugs = list(Tag.objects.values_list(
+            'slug', flat=True)[:options['tags']])
+        limit = options['limit']
+        request = RequestFactory().get('/api/recipes/')
+        data = MultiValueDict({'tags': slugs})
+
+        def exists_filter():
+            return list(RecipeFilter(
+                data, Recipe.objects.all(), request=request).qs[:limit])
+
+        def join_filter():
+            return list(Recipe.objects.filter(
+                tags__slug__in=slugs).distinct()[:limit])
+
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, теги: {", ".join(slugs)}')
+        for name, function in (('EXISTS', exists_filter),
+                               ('JOIN + DISTINCT', join_filter)):
+            function()
+            with CaptureQueriesContext(connection) as queries:
+                function()
+            query_count = len(queries)
+            seconds = Timer(function).timeit(options['repeat'])
+            self.stdout.write(
+                f'{name}: {seconds / options["repeat"] * 1e3:.2f} мс, '
+                f'запросов {query_count}')
@@ -0,0 +1,187 @@
+"""Метрики производительности запросов.
+
+Для каждого запроса собираются число и время SQL-запросов, время
+сериализации и обработки во вьюхе. Распределения копятся в гистограммах
+по маршрутам в памяти процесса и отдаются в текстовом формате Prometheus;
+при нескольких воркерах каждый процесс отдает свои значения.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Замеры одного запроса."""
+
+    __slots__ = (
+        'started', 'view_started', 'view_time', 'query_count', 'query_time',
+        'serializer_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_time = 0.0
+        self.query_count = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+
+def record_query(execute, sql, params, many, context):
+    """Обертка выполнения SQL (connection.execute_wrapper)."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query_count += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def timed_data(serializer):
+    """Данные сериализатора ответа с замером времени сериализации.
+
+    Вызывается во вьюхах для сериализатора верхнего уровня, поэтому
+    вложенные сериализаторы отдельно не учитываются.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return serializer.data
+    started = time.perf_counter()
+    try:
+        return serializer.data
+    finally:
+        stats.serializer_time += time.perf_counter() - started
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин."""
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RouteMetrics:
+    __slots__ = ('duration', 'queries', 'query_time', 'serializer_time',
+                 'statuses')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.statuses = defaultdict(int)
+
+
+class MetricsRegistry:
+    """Метрики по маршрутам (route, method) в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(RouteMetrics)
+
+    def observe(self, route, method, status_code, stats):
+        total_time = stats.total_time
+        with self.lock:
+            metrics = self.routes[route, method]
+            metrics.duration.observe(total_time)
+            metrics.queries.observe(stats.query_count)
+            metrics.query_time += stats.query_time
+            metrics.serializer_time += stats.serializer_time
+            metrics.statuses[f'{status_code // 100}xx'] += 1
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus."""
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = []
+            write_histogram(
+                lines, 'foodgram_request_duration_seconds',
+                'Время обработки запроса', routes,
+                lambda metrics: metrics.duration)
+            write_histogram(
+                lines, 'foodgram_request_queries',
+                'Число SQL-запросов на запрос', routes,
+                lambda metrics: metrics.queries)
+            for name, help_text, attribute in (
+                    ('foodgram_request_db_seconds_total',
+                     'Суммарное время SQL-запросов', 'query_time'),
+                    ('foodgram_request_serializer_seconds_total',
+                     'Суммарное время сериализации', 'serializer_time')):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (route, method), metrics in routes:
+                    lines.append(
+                        f'{name}{{{labels(route, method)}}} '
+                        f'{getattr(metrics, attribute):.6f}')
+            name = 'foodgram_requests_total'
+            lines.append(f'# HELP {name} Число запросов по классу ответа')
+            lines.append(f'# TYPE {name} counter')
+            for (route, method), metrics in routes:
+                for status_class, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        f'{name}{{{labels(route, method)},'
+                        f'status="{status_class}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def labels(route, method):
+    return f'route="{route}",method="{method}"'
+
+
+def write_histogram(lines, name, help_text, routes, get_histogram):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (route, method), metrics in routes:
+        histogram = get_histogram(metrics)
+        route_labels = labels(route, method)
+        cumulative = 0
+        for bound, count in zip(
+                histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{route_labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{route_labels}}} {histogram.total}')
+        lines.append(f'{name}_count{{{route_labels}}} {histogram.count}')
+
+
+def get_route_name(view_func, method):
+    """Имя маршрута вида RecipeViewSet.list или subscribe."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(method.lower())
+        if action:
+            return f'{cls.__name__}.{action}'
+    return cls.__name__
+
+
+registry = MetricsRegistry()
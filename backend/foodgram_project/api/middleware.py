@@ -0,0 +1,51 @@
+import time
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import (METRICS_ENABLED, RequestStats, current_stats,
+                      get_route_name, record_query, registry)
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и метрики по маршрутам для каждого запроса.
+
+    Время SQL считается оберткой выполнения запросов на всех подключениях,
+    поэтому накладные расходы — несколько вызовов perf_counter на запрос.
+    """
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        request.route_name = 'unmatched'
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        if stats.view_started is not None:
+            stats.view_time = time.perf_counter() - stats.view_started
+        response['Server-Timing'] = ', '.join((
+            f'db;desc="SQL ({stats.query_count} queries)";'
+            f'dur={stats.query_time * 1000:.2f}',
+            f'serializer;dur={stats.serializer_time * 1000:.2f}',
+            f'view;dur={stats.view_time * 1000:.2f}',
+            f'total;dur={stats.total_time * 1000:.2f}'))
+        registry.observe(
+            request.route_name, request.method, response.status_code, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.route_name = get_route_name(view_func, request.method)
+        stats = current_stats.get()
+        if stats is not None:
+            stats.view_started = time.perf_counter()
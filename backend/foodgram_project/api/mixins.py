@@ -0,0 +1,85 @@
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .cache import CATALOG_CACHE_MAX_AGE, get_params_hash, get_version
+from .db_router import get_read_database, read_database
+from .metrics import timed_data
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы к вьюсету читают данные из реплики."""
+
+    def dispatch(self, request, *args, **kwargs):
+        self.read_database_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.read_database_token is not None:
+                read_database.reset(self.read_database_token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            alias = get_read_database(request.user)
+            if alias is not None:
+                self.read_database_token = read_database.set(alias)
+
+
+class SerializerTimingMixin:
+    """Время сериализации списка и объекта попадает в метрики запроса."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(timed_data(serializer))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(timed_data(serializer))
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(timed_data(serializer))
+
+
+class VersionedETagMixin:
+    """Условные GET-запросы для редко меняющихся справочников.
+
+    ETag вычисляется из версии таблицы, которая увеличивается при каждой
+    записи, поэтому ответ 304 отдается без обращения к базе данных.
+    """
+
+    version_key = None
+    cache_max_age = CATALOG_CACHE_MAX_AGE
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_etag(self, request):
+        digest = hashlib.md5('{}:{}:{}'.format(
+            get_version(self.version_key), request.path,
+            get_params_hash(request)).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def conditional_response(self, view, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if_none_match = parse_etags(
+            request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={self.cache_max_age}'
+        return response
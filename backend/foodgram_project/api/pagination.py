@@ -1,7 +1,138 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (курсору) без COUNT(*) и OFFSET.
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    следующая страница выбирается условием «строго после курсора».
+    Поля сортировки берутся из атрибута вьюсета keyset_ordering.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 10
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_position_filter(self, position):
+        """Условие лексикографического сравнения с позицией курсора."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, obj):
+        position = [
+            getattr(obj, field.lstrip('-')) for field in self.ordering]
+        position = [
+            value.isoformat() if isinstance(value, date) else value
+            for value in position]
+        return urlsafe_b64encode(
+            json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(
+                urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (BinasciiError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list) or
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, CustomPagination.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
-    """Кастомный класс пагинации."""
+    """Кастомный класс пагинации.
+
+    По умолчанию постраничная (параметры page и limit), при передаче
+    pagination=cursor или cursor используется пагинация по ключу.
+    Параметры из атрибута вьюсета keyset_conflicting_params меняют
+    сортировку (например, поиск по релевантности), поэтому вместе с
+    пагинацией по ключу они дают ошибку 400.
+    """
 
     page_size_query_param = 'limit'
+    pagination_mode_query_param = 'pagination'
+    keyset_conflict_message = (
+        'Параметр нельзя использовать с пагинацией по курсору')
+
+    def is_keyset_mode(self, request):
+        return (
+            request.query_params.get(
+                self.pagination_mode_query_param) == 'cursor' or
+            KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.is_keyset_mode(request):
+            self.check_keyset_params(request, view)
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def check_keyset_params(self, request, view):
+        conflicts = [
+            param for param in getattr(view, 'keyset_conflicting_params', ())
+            if request.query_params.get(param, '').strip()]
+        if conflicts:
+            raise ValidationError(dict.fromkeys(
+                conflicts, [self.keyset_conflict_message]))
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
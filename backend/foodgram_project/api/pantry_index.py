@@ -0,0 +1,220 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import RecipeIngredientAmount
+from .cache import PANTRY_VERSION, bump_version, get_version
+from .db_router import use_primary
+
+PANTRY_SEARCH_LIMIT = getattr(settings, 'PANTRY_SEARCH_LIMIT', 20)
+PANTRY_INDEX_REBUILD_INTERVAL = getattr(
+    settings, 'PANTRY_INDEX_REBUILD_INTERVAL', 60)
+PANTRY_INDEX_MAX_CHANGES = getattr(settings, 'PANTRY_INDEX_MAX_CHANGES', 1000)
+
+
+class PantryIndex:
+    """Индекс ингредиент -> рецепты в памяти процесса.
+
+    Основа индекса — разреженная матрица ингредиент x рецепт в формате
+    CSR: строка ингредиента хранит позиции рецептов, в которых он есть.
+    Рецепты, измененные после сборки матрицы, хранятся в небольшом
+    словаре changed поверх нее. Индекс не меняется после создания,
+    изменения возвращают новый индекс, поэтому поиск идет без блокировок.
+    """
+
+    def __init__(self, recipe_ids, postings, ingredient_rows, changed=None,
+                 totals=None):
+        self.recipe_ids = recipe_ids
+        self.postings = postings
+        self.ingredient_rows = ingredient_rows
+        self.totals = totals if totals is not None else np.bincount(
+            postings.indices, minlength=len(recipe_ids))
+        self.changed = changed or {}
+        changed_ids = np.fromiter(
+            self.changed, dtype=np.int64, count=len(self.changed))
+        positions = np.searchsorted(recipe_ids, changed_ids)
+        found = positions < len(recipe_ids)
+        found[found] = recipe_ids[positions[found]] == changed_ids[found]
+        self.changed_positions = positions[found]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Собирает индекс из пар (recipe_id, ingredient_id)."""
+        pairs = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+        recipe_ids, recipe_positions = np.unique(
+            pairs[:, 0], return_inverse=True)
+        ingredient_ids, ingredient_positions = np.unique(
+            pairs[:, 1], return_inverse=True)
+        postings = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int8),
+             (ingredient_positions, recipe_positions)),
+            shape=(len(ingredient_ids), len(recipe_ids)))
+        postings.sum_duplicates()
+        ingredient_rows = {
+            ingredient_id: row
+            for row, ingredient_id in enumerate(ingredient_ids.tolist())}
+        return cls(recipe_ids, postings, ingredient_rows)
+
+    def __len__(self):
+        base = np.count_nonzero(self.totals) - len(self.changed_positions)
+        return base + sum(
+            1 for ingredient_ids in self.changed.values() if ingredient_ids)
+
+    def rows(self):
+        """Пары (recipe_id, ingredient_id) с учетом изменений."""
+        coo = self.postings.tocoo()
+        ingredient_ids = np.empty(len(self.ingredient_rows), dtype=np.int64)
+        for ingredient_id, row in self.ingredient_rows.items():
+            ingredient_ids[row] = ingredient_id
+        keep = ~np.isin(coo.col, self.changed_positions)
+        yield from zip(self.recipe_ids[coo.col[keep]].tolist(),
+                       ingredient_ids[coo.row[keep]].tolist())
+        for recipe_id, ingredient_ids in self.changed.items():
+            for ingredient_id in ingredient_ids:
+                yield recipe_id, ingredient_id
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        """Новый индекс, в котором у рецепта указанные ингредиенты.
+
+        Когда изменений накапливается больше PANTRY_INDEX_MAX_CHANGES,
+        они переносятся в матрицу.
+        """
+        changed = dict(self.changed)
+        changed[recipe_id] = frozenset(ingredient_ids)
+        index = PantryIndex(
+            self.recipe_ids, self.postings, self.ingredient_rows, changed,
+            self.totals)
+        if len(changed) > PANTRY_INDEX_MAX_CHANGES:
+            return PantryIndex.from_rows(index.rows())
+        return index
+
+    def remove_recipe(self, recipe_id):
+        return self.update_recipe(recipe_id, ())
+
+    def count_matches(self, ingredient_ids):
+        """Число совпавших ингредиентов для каждого рецепта матрицы."""
+        postings = self.postings
+        rows = [self.ingredient_rows[ingredient_id]
+                for ingredient_id in ingredient_ids
+                if ingredient_id in self.ingredient_rows]
+        counts = np.bincount(np.concatenate(
+            [postings.indices[postings.indptr[row]:postings.indptr[row + 1]]
+             for row in rows] or [np.empty(0, dtype=np.int32)]),
+            minlength=len(self.recipe_ids))
+        counts[self.changed_positions] = 0
+        return counts
+
+    def search(self, ingredient_ids, limit=PANTRY_SEARCH_LIMIT):
+        """Рецепты, отсортированные по доле имеющихся ингредиентов.
+
+        При равной доле выше рецепты с меньшим числом недостающих
+        ингредиентов, затем более новые. Возвращает список
+        (recipe_id, coverage, missing_count).
+        """
+        ingredient_ids = frozenset(ingredient_ids)
+        counts = self.count_matches(ingredient_ids)
+        coverage = counts / np.maximum(self.totals, 1)
+        # Кандидаты из матрицы — рецепты с долей не ниже limit-й по
+        # величине, из измененных рецептов — все с совпадениями.
+        threshold = 0
+        if 0 < limit < len(coverage):
+            threshold = np.partition(coverage, -limit)[-limit]
+        positions = np.flatnonzero(
+            coverage >= threshold if threshold > 0 else coverage)
+        extra = np.array([
+            (recipe_id, len(ingredients & ingredient_ids), len(ingredients))
+            for recipe_id, ingredients in self.changed.items()
+            if ingredients & ingredient_ids], dtype=np.int64).reshape(-1, 3)
+        recipe_ids = np.concatenate(
+            (self.recipe_ids[positions], extra[:, 0]))
+        matched = np.concatenate((counts[positions], extra[:, 1]))
+        totals = np.concatenate((self.totals[positions], extra[:, 2]))
+        coverage = matched / totals
+        missing = totals - matched
+        order = np.lexsort((-recipe_ids, missing, -coverage))[:limit]
+        return list(zip(recipe_ids[order].tolist(),
+                        coverage[order].tolist(),
+                        missing[order].tolist()))
+
+
+class PantryIndexHolder:
+    """Ленивая сборка индекса и его поддержка в актуальном состоянии.
+
+    Изменения рецептов в этом процессе применяются к индексу сразу после
+    фиксации транзакции и увеличивают версию PANTRY_VERSION в общем
+    кеше. Если версия изменилась только на эту запись, индекс остается
+    актуальным. Изменения из других процессов видны по версии: индекс
+    пересобирается, но не чаще, чем раз в PANTRY_INDEX_REBUILD_INTERVAL
+    секунд, и в это время поиск идет по прежнему индексу.
+    """
+
+    def __init__(self, interval=PANTRY_INDEX_REBUILD_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.built_at = 0
+
+    def is_fresh(self):
+        return self.index is not None and (
+            time.monotonic() - self.built_at < self.interval or
+            get_version(PANTRY_VERSION) == self.version)
+
+    def get(self):
+        if self.is_fresh():
+            return self.index
+        if not self.lock.acquire(blocking=self.index is None):
+            return self.index
+        try:
+            if not self.is_fresh():
+                self.rebuild()
+            return self.index
+        finally:
+            self.lock.release()
+
+    def rebuild(self):
+        version = get_version(PANTRY_VERSION)
+        with use_primary():
+            self.index = PantryIndex.from_rows(
+                RecipeIngredientAmount.objects.values_list(
+                    'recipe_id', 'ingredient_id').iterator())
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def search(self, ingredient_ids, limit=PANTRY_SEARCH_LIMIT):
+        return self.get().search(ingredient_ids, limit)
+
+    def apply(self, change):
+        with self.lock:
+            version = bump_version(PANTRY_VERSION)
+            if self.index is None:
+                return
+            self.index = change(self.index)
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def refresh_recipe(self, recipe_id):
+        with use_primary():
+            ingredient_ids = list(RecipeIngredientAmount.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+        self.apply(lambda index: index.update_recipe(
+            recipe_id, ingredient_ids))
+
+    def remove_recipe(self, recipe_id):
+        self.apply(lambda index: index.remove_recipe(recipe_id))
+
+    def recipe_changed(self, sender, instance, **kwargs):
+        transaction.on_commit(lambda: self.refresh_recipe(instance.pk))
+
+    def recipe_deleted(self, sender, instance, **kwargs):
+        transaction.on_commit(lambda: self.remove_recipe(instance.pk))
+
+    def recipe_ingredient_changed(self, sender, instance, **kwargs):
+        transaction.on_commit(lambda: self.refresh_recipe(instance.recipe_id))
+
+
+pantry_index = PantryIndexHolder()
@@ -20,3 +20,11 @@ class AuthorOrAdminOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         return obj.author == request.user or request.user.role == ADMIN
+
+
+class IsAdmin(permissions.BasePermission):
+    """Доступ только для администратора."""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.role == ADMIN or request.user.is_superuser)
@@ -0,0 +1,65 @@
+"""Быстрый JSON-рендерер на orjson с результатом как у JSONRenderer.
+
+Если orjson не установлен, запрошен отступ или изменены настройки
+UNICODE_JSON, COMPACT_JSON и STRICT_JSON, используется стандартный
+рендерер DRF.
+"""
+import math
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson записывает очень большие и очень маленькие числа иначе, чем json
+# (1e16 вместо 1e+16, 0.00001 вместо 1e-05). Такие ответы, как и строки,
+# случайно похожие на них, рендерятся стандартным способом. Шаблон
+# начинается с литерала, чтобы поиск по ответу оставался быстрым.
+EXPONENT = re.compile(rb'e-?[0-9]')
+SMALL_FLOAT = b'0.0000'
+LEAF_TYPES = {str, int, bool, type(None)}
+
+
+def has_non_finite(value):
+    """Есть ли в данных NaN или бесконечность."""
+    if isinstance(value, dict):
+        values = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    else:
+        return isinstance(value, float) and not math.isfinite(value)
+    # Обычно в контейнере только строки и числа: такие проверяются
+    # без обхода в Python.
+    if LEAF_TYPES.issuperset(map(type, values)):
+        return False
+    return any(map(has_non_finite, values))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer, сериализующий данные через orjson.
+
+    NaN и бесконечность orjson записывает как null. Если в ответе есть
+    null, данные проверяются, и при таких значениях ответ рендерится
+    стандартным способом, который падает с ValueError.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or
+                not self.compact or not self.strict or self.get_indent(
+                    accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            result = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if (SMALL_FLOAT in result or EXPONENT.search(result) or
+                b'null' in result and has_non_finite(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        return result.replace(
+            b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
@@ -1,16 +1,32 @@
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import (
     UserCreateSerializer as DjoserUserCreateSerializer)
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
 from recipes.models import (Favorite, Follow, Ingredient, Recipe,
-                            RecipeIngredientAmount, ShoppingCart, Tag)
+                            RecipeIngredientAmount, RecipeTag, ShoppingCart,
+                            Tag)
+from recipes.shopping_list import recipe_ingredients_changed
 from users.models import User
-from .fields import Base64ImageField
+from .fields import Base64ImageField, ImageVariantsField
+from .fieldsets import SparseFieldsMixin
 
+BULK_RECIPES_LIMIT = getattr(settings, 'BULK_RECIPES_LIMIT', 100)
 
-class UserSerializer(serializers.ModelSerializer):
+
+def get_recipes_limit(request, param='recipes_limit'):
+    """Возвращает значение параметра recipes_limit или None."""
+    try:
+        limit = int(request.query_params[param])
+    except (KeyError, ValueError):
+        return None
+    return max(limit, 0)
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для GET-запросов к модели Юзера."""
 
     email = serializers.EmailField(
@@ -25,13 +41,17 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = (
             'email', 'id',  'username', 'first_name',
-            'last_name', 'is_subscribed')
+            'last_name', 'is_subscribed', 'followers_count')
+        read_only_fields = ('followers_count',)
 
     def get_is_subscribed(self, obj):
-        if self.context['request'].user.is_authenticated:
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        user = self.context['request'].user
+        # Подписаться на самого себя нельзя.
+        if user.is_authenticated and user.pk != obj.pk:
             return Follow.objects.filter(
-                follower=self.context['request'].user,
-                following=obj).exists()
+                follower=user, following=obj).exists()
         return False
 
 
@@ -85,7 +105,7 @@ class IngredientWriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для GET-запросов к модели рецептов."""
 
     author = UserSerializer()
@@ -96,15 +116,18 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         source='recipe_to_ingredient')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
-            'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time')
+            'is_favorited', 'is_in_shopping_cart', 'favorites_count',
+            'name', 'image', 'image_variants', 'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if self.context['request'].user.is_authenticated:
             return Favorite.objects.filter(
                 user=self.context['request'].user,
@@ -112,6 +135,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if self.context['request'].user.is_authenticated:
             return ShoppingCart.objects.filter(
                 user=self.context['request'].user,
@@ -164,99 +189,148 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                     raise serializers.ValidationError(
                         'Ингредиенты рецепта не должны повторяться!')
                 ingredient_list.append(ingredient['id'])
+            existing = set(Ingredient.objects.filter(
+                id__in=ingredient_list).values_list('id', flat=True))
+            unknown = [pk for pk in ingredient_list if pk not in existing]
+            if unknown:
+                raise serializers.ValidationError(
+                    'Ингредиенты с id '
+                    f'{", ".join(map(str, unknown))} не существуют!')
             return value
         raise serializers.ValidationError(
             'У рецепта должен быть минимум 1 ингредиент!')
 
-    def create_update_recipe(self, recipe, ingredients_amounts, tags):
+    def set_ingredients(self, recipe, ingredients_amounts, created):
+        amounts = {
+            ingredient_amount['id']: ingredient_amount['amount']
+            for ingredient_amount in ingredients_amounts}
+        existing = {} if created else {
+            row.ingredient_id: row for row in
+            RecipeIngredientAmount.objects.filter(recipe=recipe)}
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            RecipeIngredientAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredientAmount.objects.bulk_update(changed, ('amount',))
         RecipeIngredientAmount.objects.bulk_create(
             [RecipeIngredientAmount(
-                recipe=recipe,
-                ingredient=get_object_or_404(
-                    Ingredient, id=ingredient_amount['id']),
-                amount=ingredient_amount['amount'])
-             for ingredient_amount in ingredients_amounts])
-        for tag in tags:
-            recipe.tags.add(tag)
-
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+             for ingredient_id, amount in amounts.items()
+             if ingredient_id not in existing])
+        if not created:
+            recipe_ingredients_changed(
+                recipe.id, removed | {row.ingredient_id for row in changed} |
+                (amounts.keys() - existing.keys()))
+
+    def set_tags(self, recipe, tags, created):
+        tag_ids = {tag.id for tag in tags}
+        existing = set() if created else set(RecipeTag.objects.filter(
+            recipe=recipe).values_list('tag_id', flat=True))
+        removed = existing - tag_ids
+        if removed:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=removed).delete()
+        added = tag_ids - existing
+        if added:
+            RecipeTag.objects.bulk_create(
+                [RecipeTag(recipe=recipe, tag_id=tag_id)
+                 for tag_id in added])
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_amounts = validated_data.pop('recipe_to_ingredient')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        self.create_update_recipe(
-            recipe=recipe,
-            ingredients_amounts=ingredients_amounts,
-            tags=tags)
+        self.set_ingredients(recipe, ingredients_amounts, created=True)
+        self.set_tags(recipe, tags, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        RecipeIngredientAmount.objects.filter(recipe=instance).delete()
-        instance.tags.clear()
         ingredients_amounts = validated_data.pop('recipe_to_ingredient')
         tags = validated_data.pop('tags')
-        self.create_update_recipe(
-            recipe=instance,
-            ingredients_amounts=ingredients_amounts,
-            tags=tags)
+        self.set_ingredients(instance, ingredients_amounts, created=False)
+        self.set_tags(instance, tags, created=False)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'recipe_to_ingredient',
+                queryset=RecipeIngredientAmount.objects.select_related(
+                    'ingredient')))
         return RecipeReadSerializer(instance=instance, context=context).data
 
 
 class SubscribeFavoriteRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения рецептов для подписок и избранного."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class PantryRecipeSerializer(SubscribeFavoriteRecipeSerializer):
+    """Сериализатор рецептов, подобранных по имеющимся ингредиентам."""
 
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
 
-class SubscribeUserSerializer(serializers.ModelSerializer):
+    class Meta(SubscribeFavoriteRecipeSerializer.Meta):
+        fields = SubscribeFavoriteRecipeSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients')
+
+
+class SubscribeUserSerializer(SparseFieldsMixin,
+                              serializers.ModelSerializer):
     """Сериализатор для отображения Юзера в сериализаторе подписок."""
 
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             'email', 'id',  'username', 'first_name',
-            'last_name', 'is_subscribed', 'recipes', 'recipes_count')
+            'last_name', 'is_subscribed', 'followers_count',
+            'recipes', 'recipes_count')
+        read_only_fields = fields
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            follower=self.context['request'].user,
-            following=obj).exists()
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.all().count()
+        return True
 
     def get_recipes(self, obj):
-        if self.context['request'].query_params.get('recipes_limit'):
-            limit = int(
-                self.context['request'].query_params.get('recipes_limit'))
-            return SubscribeFavoriteRecipeSerializer(
-                obj.recipes.all(), many=True).data[0:limit]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = obj.recipes.all()
+            limit = get_recipes_limit(self.context['request'])
+            if limit is not None:
+                recipes = recipes[:limit]
         return SubscribeFavoriteRecipeSerializer(
-            obj.recipes.all(), many=True).data
+            recipes, many=True, context=self.context).data
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели подписок."""
+class BulkRecipesSerializer(serializers.Serializer):
+    """Список id рецептов для массовых операций."""
 
-    class Meta:
-        model = Follow
-        fields = ()
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=BULK_RECIPES_LIMIT)
 
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return SubscribeUserSerializer(
-            instance=instance.following, context=context).data
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
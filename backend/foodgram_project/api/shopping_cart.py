@@ -0,0 +1,45 @@
+import csv
+import json
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_text(rows):
+    """Построчно отдает список покупок в текстовом формате."""
+    for name, measurement_unit, amount in rows:
+        yield f'- {name}({measurement_unit}) - {amount}\n'
+
+
+def render_csv(rows):
+    """Построчно отдает список покупок в формате csv."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_json(rows):
+    """Поэлементно отдает список покупок в виде json-массива."""
+    separator = '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name,
+             'measurement_unit': measurement_unit,
+             'amount': amount},
+            ensure_ascii=False)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_CART_DEFAULT_FORMAT = 'text'
+
+SHOPPING_CART_FORMATS = {
+    'text': (render_text, 'text/plain; charset=utf-8', 'txt'),
+    'csv': (render_csv, 'text/csv; charset=utf-8', 'csv'),
+    'json': (render_json, 'application/json; charset=utf-8', 'json'),
+}
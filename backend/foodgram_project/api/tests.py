@@ -0,0 +1,1073 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.core.handlers.wsgi import get_path_info
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+from recipes.counters import change_counters
+from recipes.images import process_recipe_image
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCart, Tag)
+from recipes.similarity import compute_neighbours
+from users.models import User
+from .asgi import ASGIHandler
+from .authentication import token_cache
+from .cache import INGREDIENTS_VERSION, bump_version
+from .fieldsets import FieldSet, parse_fields
+from .ingredient_index import IngredientIndex, IngredientIndexHolder
+from .pantry_index import PantryIndex, pantry_index
+from .renderers import FastJSONRenderer, orjson
+
+BUMP_INGREDIENTS_VERSION = (
+    'import django; django.setup(); '
+    'from api.cache import INGREDIENTS_VERSION, bump_version; '
+    'bump_version(INGREDIENTS_VERSION)')
+CHECK_STICKY_FLAG = (
+    'import sys, django; django.setup(); '
+    'from django.core.cache import caches; '
+    'from api.db_router import REPLICA_STICKY_CACHE, STICKY_KEY; '
+    'sys.exit(caches[REPLICA_STICKY_CACHE].get(STICKY_KEY.format({})) '
+    'is not True)')
+INVALIDATE_USER = (
+    'import django; django.setup(); '
+    'from api.authentication import invalidate_user; '
+    'invalidate_user({})')
+
+
+class VersionsCacheMixin:
+    """Версии данных хранятся во временном каталоге теста."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        versions = dict(
+            settings.CACHES['versions'], LOCATION=self.location,
+            BACKEND='django.core.cache.backends.filebased.FileBasedCache')
+        settings_override = override_settings(
+            CACHES=dict(settings.CACHES, versions=versions))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_in_other_process(self, code):
+        """Выполняет код в отдельном процессе с тем же кешем версий."""
+        subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, check=True,
+            env=dict(os.environ,
+                     DJANGO_SETTINGS_MODULE='foodgram_project.settings',
+                     VERSION_CACHE_BACKEND=(
+                         'django.core.cache.backends.filebased.'
+                         'FileBasedCache'),
+                     VERSION_CACHE_LOCATION=self.location))
+
+
+class PrimaryReadsMixin:
+    """Чтение только из основной базы.
+
+    Данные TestCase не зафиксированы и через подключение реплики не видны.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('api.db_router.REPLICA_DATABASES', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class IngredientETagTest(PrimaryReadsMixin, VersionsCacheMixin, TestCase):
+    """ETag справочника ингредиентов общий для всех процессов."""
+
+    def setUp(self):
+        super().setUp()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def test_write_from_other_process_changes_etag(self):
+        etag = self.client.get('/api/ingredients/')['ETag']
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.run_in_other_process(BUMP_INGREDIENTS_VERSION)
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class IngredientIndexTest(SimpleTestCase):
+    """Поиск ингредиентов: начало названия, подстрока, опечатки."""
+
+    def setUp(self):
+        self.index = IngredientIndex(
+            (pk, name, 'г') for pk, name in enumerate((
+                'соль', 'соль поваренная', 'соленые огурцы', 'фасоль',
+                'сахар', 'мука пшеничная', 'масло сливочное'), 1))
+
+    def search(self, query):
+        return [item['name'] for item in self.index.search(query)]
+
+    def test_prefix_then_substring(self):
+        self.assertEqual(self.search('Сол'), [
+            'соленые огурцы', 'соль', 'соль поваренная', 'фасоль'])
+
+    def test_typo(self):
+        self.assertEqual(self.search('сохар'), ['сахар'])
+        self.assertEqual(self.search('пшенечная'), ['мука пшеничная'])
+
+    def test_typo_in_several_words(self):
+        for query, name in (('мука пшенечная', 'мука пшеничная'),
+                            ('пшенечная мука', 'мука пшеничная'),
+                            ('сливачное масл', 'масло сливочное')):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [name])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search('', limit=3)), 3)
+
+
+class IngredientIndexHolderTest(PrimaryReadsMixin, VersionsCacheMixin,
+                                TestCase):
+    """Версия ингредиентов проверяется только по истечении срока."""
+
+    def setUp(self):
+        super().setUp()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.holder = IngredientIndexHolder(ttl=60)
+
+    def test_version_checked_after_ttl(self):
+        self.assertEqual(len(self.holder.get()), 1)
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        bump_version(INGREDIENTS_VERSION)
+        with mock.patch('api.ingredient_index.get_version') as get_version:
+            self.assertEqual(len(self.holder.get()), 1)
+        get_version.assert_not_called()
+        with mock.patch('api.ingredient_index.time.monotonic',
+                        return_value=time.monotonic() + 61):
+            self.assertEqual(len(self.holder.get()), 2)
+
+    def test_same_version_keeps_index(self):
+        index = self.holder.get()
+        self.holder.expire()
+        self.assertIs(self.holder.get(), index)
+
+
+class TokenCacheTest(PrimaryReadsMixin, VersionsCacheMixin, TestCase):
+    """Закешированный токен перестает действовать во всех процессах."""
+
+    def setUp(self):
+        super().setUp()
+        token_cache.entries.clear()
+        self.addCleanup(token_cache.entries.clear)
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        token = Token.objects.create(user=self.user)
+        self.user_client = APIClient()
+        self.user_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_deactivation_in_other_process_rejects_token(self):
+        self.assertEqual(self.user_client.get('/api/users/me/').status_code,
+                         200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.user_client.get('/api/users/me/').status_code,
+                         200)
+        self.run_in_other_process(INVALIDATE_USER.format(self.user.pk))
+        self.assertEqual(self.user_client.get('/api/users/me/').status_code,
+                         401)
+
+    def test_local_versions_cache_disables_token_cache(self):
+        self.user_client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        versions = dict(
+            settings.CACHES['versions'],
+            BACKEND='django.core.cache.backends.locmem.LocMemCache')
+        with override_settings(
+                CACHES=dict(settings.CACHES, versions=versions)):
+            response = self.user_client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_me_without_queries(self):
+        self.user_client.get('/api/users/me/')
+        with self.assertNumQueries(0):
+            response = self.user_client.get('/api/users/me/')
+        self.assertEqual(response.data['followers_count'], 0)
+        self.assertIs(response.data['is_subscribed'], False)
+
+    def test_counter_change_refreshes_cached_user(self):
+        self.user_client.get('/api/users/me/')
+        change_counters(User, 'followers_count', [self.user.pk], 1)
+        response = self.user_client.get('/api/users/me/')
+        self.assertEqual(response.data['followers_count'], 1)
+
+
+class AnonymousRecipeCacheTest(VersionsCacheMixin, TransactionTestCase):
+    """Кеш рецептов для анонимов сбрасывается только изменениями данных."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='author-password', first_name='Анна',
+            last_name='Иванова')
+        Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=10)
+        self.client.get('/api/recipes/')
+
+    def get_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/recipes/')
+        return len(queries)
+
+    def test_login_keeps_cache(self):
+        response = self.client.post('/api/auth/token/login/', {
+            'email': 'author@example.com', 'password': 'author-password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_list_queries(), 0)
+
+    def test_password_change_keeps_cache(self):
+        self.author.set_password('new-password')
+        self.author.save()
+        self.assertEqual(self.get_list_queries(), 0)
+
+    def test_author_name_change_resets_cache(self):
+        self.author.first_name = 'Мария'
+        self.author.save()
+        self.assertGreater(self.get_list_queries(), 0)
+
+    def test_favorites_count_resets_cache(self):
+        recipe = Recipe.objects.get()
+        self.client.get(f'/api/recipes/{recipe.pk}/')
+        favorite = Favorite.objects.create(user=self.author, recipe=recipe)
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.json()[0]['favorites_count'], 1)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.json()['favorites_count'], 1)
+        favorite.delete()
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.json()['favorites_count'], 0)
+
+
+class RecipeImageCacheTest(VersionsCacheMixin, TransactionTestCase):
+    """Кеш рецепта сбрасывается, когда готовы варианты изображения."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(media_root, 'recipes'))
+        Image.new('RGB', (800, 600)).save(
+            os.path.join(media_root, 'recipes', 'soup.png'))
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        # bulk_create не ставит обработку изображения в очередь.
+        Recipe.objects.bulk_create([Recipe(
+            author=author, name='Суп', text='Текст', cooking_time=10,
+            image='recipes/soup.png')])
+        self.recipe = Recipe.objects.get()
+
+    def get_thumbnail(self, url):
+        return self.client.get(url).json()['image_variants'][
+            'thumbnail']['webp']
+
+    def test_processed_image_resets_cache(self):
+        detail_url = f'/api/recipes/{self.recipe.pk}/'
+        self.assertNotIn('variants', self.get_thumbnail(detail_url))
+        self.client.get('/api/recipes/?limit=6')
+        self.assertTrue(process_recipe_image(
+            self.recipe.pk, 'recipes/soup.png'))
+        self.assertIn('variants', self.get_thumbnail(detail_url))
+        response = self.client.get('/api/recipes/?limit=6')
+        self.assertIn('variants', response.json()['results'][0][
+            'image_variants']['thumbnail']['webp'])
+
+
+class RecipeQueriesTest(PrimaryReadsMixin, VersionsCacheMixin, TestCase):
+    """Число запросов к базе не зависит от числа рецептов на странице."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        tags = [Tag.objects.create(name=f'Тег {index}', color=f'#00000{index}',
+                                   slug=f'tag{index}') for index in range(2)]
+        ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(3)]
+        for index in range(50):
+            author = User.objects.create_user(
+                username=f'author{index}', email=f'author{index}@example.com',
+                password='pass')
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {index}', text='Текст',
+                cooking_time=10, image='recipes/soup.png')
+            recipe.tags.set(tags)
+            RecipeIngredientAmount.objects.bulk_create(
+                RecipeIngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients)
+        cls.recipe = recipe
+
+    def setUp(self):
+        super().setUp()
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def test_list_anonymous(self):
+        for limit in (5, 50):
+            with self.subTest(limit=limit):
+                url = f'/api/recipes/?limit={limit}'
+                with self.assertNumQueries(5):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.json()['results']), limit)
+                with self.assertNumQueries(0):
+                    self.client.get(url)
+
+    def test_list_authenticated(self):
+        for limit in (5, 50):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(5):
+                    response = self.user_client.get(
+                        f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_retrieve_anonymous(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_retrieve_authenticated(self):
+        with self.assertNumQueries(4):
+            response = self.user_client.get(
+                f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_sparse_fields(self):
+        with self.assertNumQueries(3):
+            response = self.user_client.get(
+                '/api/recipes/?limit=5&fields=id,name,author.username')
+        self.assertEqual(
+            [set(recipe) for recipe in response.json()['results']],
+            [{'id', 'name', 'author'}] * 5)
+        self.assertEqual(
+            set(response.json()['results'][0]['author']), {'username'})
+
+    def test_list_omit(self):
+        with self.assertNumQueries(3):
+            response = self.user_client.get(
+                '/api/recipes/?limit=5&omit=text,tags,ingredients,'
+                'is_favorited,is_in_shopping_cart,author.is_subscribed')
+        recipe = response.json()['results'][0]
+        self.assertEqual(
+            set(recipe), {'id', 'author', 'image', 'image_variants', 'name',
+                          'cooking_time', 'favorites_count'})
+        self.assertNotIn('is_subscribed', recipe['author'])
+
+    def test_anonymous_cache_per_fields(self):
+        full = self.client.get('/api/recipes/?limit=5').json()
+        sparse = self.client.get('/api/recipes/?limit=5&fields=id').json()
+        self.assertIn('name', full['results'][0])
+        self.assertEqual(
+            sparse['results'][0], {'id': full['results'][0]['id']})
+
+
+class FieldSetTest(SimpleTestCase):
+    """Разбор параметров ?fields= и ?omit=."""
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields('id, author.username,author.id,'), {
+            'id': {}, 'author': {'username': {}, 'id': {}}})
+
+    def test_contains_and_nested(self):
+        fieldset = FieldSet(
+            parse_fields('id,author.id'), parse_fields('author.email'))
+        self.assertIn('id', fieldset)
+        self.assertNotIn('name', fieldset)
+        self.assertEqual(fieldset.nested('author').include, {'id': {}})
+        fieldset = FieldSet(None, parse_fields('text,author.email'))
+        self.assertNotIn('text', fieldset)
+        self.assertIn('author', fieldset)
+        author = fieldset.nested('author')
+        self.assertIn('id', author)
+        self.assertNotIn('email', author)
+
+
+class RecipeWriteTest(PrimaryReadsMixin, TestCase):
+    """Изменение рецепта трогает только измененные ингредиенты и теги."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', slug=f'tag-{index}',
+                color=f'#00000{index}')
+            for index in range(3)]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(31)]
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.image = 'data:image/png;base64,' + base64.b64encode(
+            buffer.getvalue()).decode()
+        self.recipe = self.create_recipe({
+            ingredient.pk: 10 for ingredient in self.ingredients[:3]},
+            self.tags[:2])
+
+    def get_data(self, amounts, tags):
+        return {
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+            'image': self.image, 'tags': [tag.pk for tag in tags],
+            'ingredients': [{'id': pk, 'amount': amount}
+                            for pk, amount in amounts.items()]}
+
+    def create_recipe(self, amounts, tags):
+        response = self.user_client.post(
+            '/api/recipes/', self.get_data(amounts, tags), format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def update_recipe(self, recipe, amounts, tags):
+        return self.user_client.put(
+            f'/api/recipes/{recipe.pk}/', self.get_data(amounts, tags),
+            format='json')
+
+    def get_rows(self, recipe):
+        return {row.ingredient_id: (row.pk, row.amount) for row in
+                RecipeIngredientAmount.objects.filter(recipe=recipe)}
+
+    def test_update_diffs_ingredients_and_tags(self):
+        first, second, third, fourth = self.ingredients[:4]
+        rows = self.get_rows(self.recipe)
+        response = self.update_recipe(
+            self.recipe, {first.pk: 10, second.pk: 20, fourth.pk: 5},
+            self.tags[1:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_rows(self.recipe), {
+            first.pk: rows[first.pk],
+            second.pk: (rows[second.pk][0], 20),
+            fourth.pk: (mock.ANY, 5)})
+        self.assertEqual(
+            set(self.recipe.tags.values_list('pk', flat=True)),
+            {tag.pk for tag in self.tags[1:]})
+        self.assertEqual(
+            {item['id']: item['amount']
+             for item in response.data['ingredients']},
+            {first.pk: 10, second.pk: 20, fourth.pk: 5})
+
+    def test_unknown_ingredients(self):
+        response = self.update_recipe(
+            self.recipe, {self.ingredients[0].pk: 1, 999998: 1, 999999: 1},
+            self.tags[:1])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999998, 999999', str(response.data['ingredients']))
+        self.assertEqual(len(self.get_rows(self.recipe)), 3)
+
+    def test_update_queries_do_not_grow_with_ingredients(self):
+        counts = []
+        for size in (3, 30):
+            recipe = self.create_recipe({
+                ingredient.pk: 1 for ingredient in self.ingredients[:size]},
+                self.tags)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.update_recipe(recipe, {
+                    ingredient.pk: 2 for ingredient in
+                    self.ingredients[1:size + 1]}, self.tags[:1])
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class TagFilterTest(PrimaryReadsMixin, VersionsCacheMixin,
+                    TransactionTestCase):
+    """Фильтр по тегам не дублирует рецепты и кеширует теги."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.breakfast, self.lunch, self.dinner = (
+            Tag.objects.create(name=slug, slug=slug, color=color)
+            for slug, color in (('breakfast', '#000001'),
+                                ('lunch', '#000002'),
+                                ('dinner', '#000003')))
+        for name, tags in (('Омлет', (self.breakfast, self.lunch)),
+                           ('Суп', (self.lunch,)),
+                           ('Стейк', (self.dinner,))):
+            recipe = Recipe.objects.create(
+                author=self.user, name=name, text='Текст', cooking_time=10)
+            recipe.tags.set(tags)
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def get_names(self, *tags):
+        response = self.user_client.get(
+            '/api/recipes/', {'limit': 10, 'tags': tags})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'],
+                         len(response.data['results']))
+        return sorted(recipe['name'] for recipe in response.data['results'])
+
+    def test_filter_without_duplicates(self):
+        self.assertEqual(self.get_names('breakfast', 'lunch'),
+                         ['Омлет', 'Суп'])
+        self.assertEqual(self.get_names('dinner'), ['Стейк'])
+        self.assertEqual(self.get_names(), ['Омлет', 'Стейк', 'Суп'])
+
+    def test_unknown_tag(self):
+        response = self.user_client.get('/api/recipes/', {'tags': 'brunch'})
+        self.assertEqual(response.status_code, 400)
+
+    def reads_tag_map(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_names('lunch')
+        return any(
+            query['sql'].startswith(
+                'SELECT "recipes_tag"."slug", "recipes_tag"."id"')
+            for query in queries.captured_queries)
+
+    def test_tag_map_cached_until_tags_change(self):
+        self.assertTrue(self.reads_tag_map())
+        self.assertFalse(self.reads_tag_map())
+        Tag.objects.create(name='brunch', slug='brunch', color='#000004')
+        self.assertEqual(self.get_names('brunch'), [])
+
+
+class FeedTest(PrimaryReadsMixin, TransactionTestCase):
+    """Лента отдает рецепты авторов из подписок постранично по курсору."""
+
+    url = '/api/recipes/feed/'
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        other = User.objects.create_user(
+            username='other', email='other@example.com', password='pass')
+        self.follow = Follow.objects.create(
+            follower=self.user, following=self.author)
+        for name, author in (('Суп', self.author), ('Каша', other),
+                             ('Омлет', self.author), ('Рагу', self.author)):
+            Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=10)
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def get_page(self, url, params=None):
+        response = self.user_client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return ([recipe['name'] for recipe in response.data['results']],
+                response.data['next'])
+
+    def test_pages(self):
+        names, next_url = self.get_page(self.url, {'limit': 2})
+        self.assertEqual(names, ['Рагу', 'Омлет'])
+        names, next_url = self.get_page(next_url)
+        self.assertEqual(names, ['Суп'])
+        self.assertIsNone(next_url)
+
+    def test_unfollow(self):
+        self.follow.delete()
+        self.assertEqual(self.get_page(self.url), ([], None))
+
+    def test_anonymous(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class SimilarRecipesTest(PrimaryReadsMixin, TransactionTestCase):
+    """Похожие рецепты отдаются по убыванию сходства."""
+
+    def setUp(self):
+        super().setUp()
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        salt, pepper, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'перец', 'сахар'))
+        self.recipes = {}
+        for name, ingredients in (('Суп', (salt, pepper)),
+                                  ('Рагу', (salt, pepper)),
+                                  ('Соус', (salt,)),
+                                  ('Компот', (sugar,))):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=10)
+            RecipeIngredientAmount.objects.bulk_create(
+                RecipeIngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients)
+            self.recipes[name] = recipe
+        compute_neighbours(workers=1)
+
+    def get_similar(self, name):
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[name].pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()]
+
+    def test_similar(self):
+        self.assertEqual(self.get_similar('Суп'), ['Рагу', 'Соус'])
+        self.assertEqual(self.get_similar('Компот'), [])
+
+
+class PantryIndexTest(SimpleTestCase):
+    """Поиск по индексу ингредиент -> рецепты."""
+
+    def setUp(self):
+        # Рецепт 1: 1, 2; рецепт 2: 1, 2, 3; рецепт 3: 3; рецепт 4: 1.
+        self.index = PantryIndex.from_rows(
+            [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 3), (4, 1)])
+
+    def test_search_order(self):
+        self.assertEqual(self.index.search({1, 2}), [
+            (4, 1.0, 0), (1, 1.0, 0), (2, 2 / 3, 1)])
+        self.assertEqual(self.index.search({1, 2}, limit=1), [(4, 1.0, 0)])
+        self.assertEqual(self.index.search({5}), [])
+        self.assertEqual(len(self.index), 4)
+
+    def test_update_and_remove_recipe(self):
+        index = self.index.update_recipe(3, {1, 2}).update_recipe(5, {2})
+        index = index.remove_recipe(4)
+        self.assertEqual(index.search({1, 2}), [
+            (5, 1.0, 0), (3, 1.0, 0), (1, 1.0, 0), (2, 2 / 3, 1)])
+        self.assertEqual(self.index.search({1, 2}, limit=1), [(4, 1.0, 0)])
+        self.assertEqual(len(index), 4)
+
+    @mock.patch('api.pantry_index.PANTRY_INDEX_MAX_CHANGES', 1)
+    def test_changes_merge_into_matrix(self):
+        index = self.index.update_recipe(3, {1, 2}).update_recipe(5, {2})
+        self.assertEqual(index.changed, {})
+        self.assertEqual(sorted(index.rows()), [
+            (1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 1), (3, 2), (4, 1),
+            (5, 2)])
+
+
+class PantryTest(PrimaryReadsMixin, VersionsCacheMixin, TransactionTestCase):
+    """Рецепты по имеющимся ингредиентам с учетом изменений рецептов."""
+
+    url = '/api/recipes/pantry/'
+
+    def setUp(self):
+        super().setUp()
+        pantry_index.index = None
+        self.addCleanup(setattr, pantry_index, 'index', None)
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.salt, self.milk, self.eggs = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'молоко', 'яйца'))
+        self.recipes = {}
+        for name, ingredients in (('Омлет', (self.milk, self.eggs)),
+                                  ('Каша', (self.milk, self.salt))):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=10)
+            RecipeIngredientAmount.objects.bulk_create(
+                RecipeIngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients)
+            self.recipes[name] = recipe
+
+    def search(self, *ingredients):
+        response = self.client.get(self.url, {'ingredients': ','.join(
+            str(ingredient.pk) for ingredient in ingredients)})
+        self.assertEqual(response.status_code, 200)
+        return [(recipe['name'], recipe['coverage'],
+                 recipe['missing_ingredients'])
+                for recipe in response.json()]
+
+    def test_search(self):
+        self.assertEqual(self.search(self.milk, self.eggs), [
+            ('Омлет', 1.0, 0), ('Каша', 0.5, 1)])
+
+    def test_changed_ingredients(self):
+        self.search(self.milk)
+        RecipeIngredientAmount.objects.filter(
+            recipe=self.recipes['Омлет'], ingredient=self.milk).delete()
+        self.recipes['Каша'].delete()
+        self.assertEqual(self.search(self.milk, self.eggs), [
+            ('Омлет', 1.0, 0)])
+
+    def test_invalid_ingredients(self):
+        response = self.client.get(self.url, {'ingredients': 'соль'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ShoppingCartDownloadTest(PrimaryReadsMixin, TransactionTestCase):
+    """Список покупок суммирует ингредиенты и отдается одним запросом."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        milk = Ingredient.objects.create(
+            name='молоко, "домашнее"', measurement_unit='мл')
+        for name, amounts in (('Каша', ((salt, 5), (milk, 200))),
+                              ('Омлет', ((salt, 2),))):
+            recipe = Recipe.objects.create(
+                author=self.user, name=name, text='Текст', cooking_time=10)
+            RecipeIngredientAmount.objects.bulk_create(
+                RecipeIngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=amount)
+                for ingredient, amount in amounts)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def download(self, file_format):
+        with self.assertNumQueries(1):
+            response = self.user_client.get(
+                self.url, {'file_format': file_format})
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        return response, content
+
+    def test_text(self):
+        response, content = self.download('text')
+        self.assertEqual(
+            content, '- молоко, "домашнее"(мл) - 200\n- соль(г) - 7\n')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename=shopping_cart_to_download.txt')
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertEqual(content.splitlines(), [
+            'name,measurement_unit,amount',
+            '"молоко, ""домашнее""",мл,200',
+            'соль,г,7'])
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+
+    def test_json(self):
+        _, content = self.download('json')
+        self.assertEqual(json.loads(content), [
+            {'name': 'молоко, "домашнее"', 'measurement_unit': 'мл',
+             'amount': 200},
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 7}])
+
+    def test_unknown_format(self):
+        response = self.user_client.get(self.url, {'file_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_cart(self):
+        ShoppingCart.objects.all().delete()
+        response = self.user_client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+
+
+class SubscriptionsTest(PrimaryReadsMixin, TransactionTestCase):
+    """Подписки отдают первые recipes_limit рецептов каждого автора."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.recipe_names = {}
+        for index in range(4):
+            author = User.objects.create_user(
+                username=f'author{index}', email=f'author{index}@example.com',
+                password='pass')
+            Follow.objects.create(follower=self.user, following=author)
+            self.recipe_names[author.pk] = [
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {index}-{number}',
+                    text='Текст', cooking_time=10).name
+                for number in range(3)][::-1]
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def get_subscriptions(self, params):
+        response = self.user_client.get(f'/api/users/subscriptions/?{params}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_recipes_limit(self):
+        for limit in (0, 2, 5):
+            with self.subTest(limit=limit):
+                for author in self.get_subscriptions(
+                        f'limit=10&recipes_limit={limit}'):
+                    self.assertEqual(
+                        [recipe['name'] for recipe in author['recipes']],
+                        self.recipe_names[author['id']][:limit])
+                    self.assertEqual(author['recipes_count'], 3)
+                    self.assertTrue(author['is_subscribed'])
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 4):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                authors = self.get_subscriptions(
+                    f'limit={limit}&recipes_limit=2')
+            self.assertEqual(len(authors), limit)
+
+
+class SerializerTimingTest(PrimaryReadsMixin, TestCase):
+    """Время сериализации замеряется во вьюхах, без подмены DRF."""
+
+    def setUp(self):
+        super().setUp()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def test_server_timing_has_serializer_time(self):
+        response = self.client.get('/api/ingredients/')
+        timings = dict(
+            item.split(';dur=') for item in response['Server-Timing'].split(
+                ', ') if item.startswith(('serializer', 'total')))
+        self.assertGreater(float(timings['serializer']), 0)
+        self.assertLessEqual(
+            float(timings['serializer']), float(timings['total']))
+
+    def test_base_serializer_is_not_patched(self):
+        self.assertEqual(BaseSerializer.__dict__['data'].fget.__module__,
+                         'rest_framework.serializers')
+
+
+class KeysetSearchTest(PrimaryReadsMixin, TestCase):
+    """Поиск по релевантности не сочетается с пагинацией по курсору."""
+
+    def test_search_with_cursor_pagination_is_rejected(self):
+        for params in ('search=суп&pagination=cursor',
+                       'search=суп&cursor=W10'):
+            with self.subTest(params=params):
+                response = self.client.get(f'/api/recipes/?{params}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('search', response.json())
+
+    def test_cursor_pagination_without_search(self):
+        response = self.client.get('/api/recipes/?search=&pagination=cursor')
+        self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(settings.REPLICA_DATABASES,
+            'Нужна реплика: задайте DB_REPLICA_HOSTS')
+class ReplicaRoutingTest(VersionsCacheMixin, TransactionTestCase):
+    """Чтение из реплики и из основной базы после записи пользователя.
+
+    Реплика в тестах — зеркало основной базы (TEST MIRROR), поэтому
+    данные видны в обеих, а различаются только подключения.
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.replica = settings.REPLICA_DATABASES[0]
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=10)
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def get_read_aliases(self, client):
+        """Алиасы баз, к которым обратился список рецептов."""
+        contexts = {
+            alias: CaptureQueriesContext(connections[alias])
+            for alias in (DEFAULT_DB_ALIAS, self.replica)}
+        with ExitStack() as stack:
+            for context in contexts.values():
+                stack.enter_context(context)
+            response = client.get('/api/recipes/?limit=6')
+        self.assertEqual(response.status_code, 200)
+        return {alias for alias, context in contexts.items() if len(context)}
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(
+            self.get_read_aliases(self.user_client), {self.replica})
+
+    def test_reads_after_post_go_to_primary(self):
+        response = self.user_client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.get_read_aliases(self.user_client), {DEFAULT_DB_ALIAS})
+        self.assertEqual(
+            self.get_read_aliases(self.author_client), {self.replica})
+
+    def test_reads_after_patch_go_to_primary(self):
+        tag = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        response = self.author_client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {
+                'name': 'Борщ', 'tags': [tag.pk],
+                'ingredients': [{'id': ingredient.pk, 'amount': 5}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.get_read_aliases(self.author_client), {DEFAULT_DB_ALIAS})
+
+    def test_reads_after_delete_go_to_primary(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.user_client.delete(
+            f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.get_read_aliases(self.user_client), {DEFAULT_DB_ALIAS})
+
+    def test_sticky_flag_is_visible_to_other_processes(self):
+        self.user_client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.run_in_other_process(CHECK_STICKY_FLAG.format(self.user.pk))
+
+
+class WSGIBody:
+    """Тело WSGI-ответа, которое отмечает свое закрытие."""
+
+    def __init__(self, chunks, closed):
+        self.chunks = iter(chunks)
+        self.closed = closed
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.closed.set()
+
+
+class ASGIHandlerTest(SimpleTestCase):
+    """Передача запроса и ответа между ASGI и WSGI-приложением."""
+
+    def setUp(self):
+        self.environ = None
+        self.sent = []
+        self.closed = threading.Event()
+        self.chunk_sent = threading.Event()
+
+    def call(self, wsgi_application, scope=None, disconnect_after=None):
+        """Выполняет запрос, отключая клиента после disconnect_after
+        отправленных частей тела."""
+        handler = ASGIHandler(wsgi_application, 1, 1)
+        self.addCleanup(handler.read_executor.shutdown)
+        self.addCleanup(handler.write_executor.shutdown)
+        scope = dict({'type': 'http', 'method': 'GET', 'path': '/',
+                      'headers': []}, **(scope or {}))
+
+        async def run():
+            disconnected = asyncio.Event()
+            messages = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                self.sent.append(message)
+                if message.get('more_body'):
+                    self.chunk_sent.set()
+                    chunks = len(self.sent) - 1
+                    if chunks == disconnect_after:
+                        disconnected.set()
+
+            await handler(scope, receive, send)
+
+        asyncio.run(run())
+
+    def application(self, chunks):
+        def application(environ, start_response):
+            self.environ = environ
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return WSGIBody(chunks, self.closed)
+        return application
+
+    def test_chunks_are_sent_as_they_are_produced(self):
+        def chunks():
+            yield b'first'
+            # Вторая часть формируется только после отправки первой.
+            self.assertTrue(self.chunk_sent.wait(5))
+            yield b'second'
+
+        self.call(self.application(chunks()))
+        self.assertEqual(self.sent[0]['status'], 200)
+        self.assertEqual([message['body'] for message in self.sent[1:]],
+                         [b'first', b'second', b''])
+        self.assertTrue(self.closed.is_set())
+
+    def test_disconnect_stops_response(self):
+        produced = []
+
+        def chunks():
+            for index in range(1000):
+                produced.append(index)
+                yield b'chunk'
+
+        self.call(self.application(chunks()), disconnect_after=1)
+        self.assertTrue(self.closed.is_set())
+        self.assertLess(len(produced), 1000)
+        self.assertNotIn(
+            {'type': 'http.response.body', 'body': b''}, self.sent)
+
+    def test_non_ascii_path(self):
+        self.call(self.application([b'']), {'path': '/api/рецепты/'})
+        self.assertEqual(get_path_info(self.environ), '/api/рецепты/')
+
+    def test_repeated_headers(self):
+        self.call(self.application([b'']), {'headers': [
+            (b'cookie', b'a=1'), (b'cookie', b'b=2'),
+            (b'accept', b'text/html'), (b'accept', b'*/*')]})
+        self.assertEqual(self.environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(self.environ['HTTP_ACCEPT'], 'text/html,*/*')
+
+
+@skipUnless(orjson, 'orjson не установлен')
+class FastJSONRendererTest(SimpleTestCase):
+    """Рендерер на orjson дает тот же результат, что и JSONRenderer."""
+
+    def assertRendersAsJSON(self, data):
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_exponent_and_small_floats(self):
+        for value in (1e16, 1.5e-7, 0.00001, -0.00002, 123.5):
+            with self.subTest(value=value):
+                self.assertRendersAsJSON({'score': value})
+
+    def test_strings_like_exponent(self):
+        self.assertRendersAsJSON({'name': 'Тесто e-5', 'code': '0.00001'})
+
+    def test_non_finite_floats_raise(self):
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                FastJSONRenderer().render(
+                    {'next': None, 'results': [{'score': value}]})
+
+    def test_null_values(self):
+        self.assertRendersAsJSON(
+            {'next': None, 'results': [{'score': 0.5, 'image': None}]})
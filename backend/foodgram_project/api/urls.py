@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (IngredientViewSet, RecipeViewSet, SubscribtionsViewSet,
-                    TagViewSet, subscribe)
+                    TagViewSet, metrics, subscribe)
 
 app_name = 'api'
 
@@ -19,6 +19,7 @@ v1_router.register(
 urlpatterns = [
     path('', include(v1_router.urls)),
     path('users/<int:pk>/subscribe/', subscribe, name='subscribe'),
+    path('metrics/', metrics, name='metrics'),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,5 +1,9 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from itertools import chain
+
+from django.core.cache import cache
+from django.db.models import (Exists, F, OuterRef, Prefetch, Subquery,
+                              prefetch_related_objects)
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, status, viewsets
@@ -8,48 +12,147 @@ from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from recipes.models import (Favorite, Follow, Ingredient, Recipe, ShoppingCart,
-                            Tag)
+from recipes.bulk import bulk_add, bulk_remove
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCart,
+                            ShoppingListItem, Tag)
 from users.models import User
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import CustomPagination
-from .permissions import AuthorOrAdminOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeReadSerializer, RecipeWriteSerializer,
-                          ShoppingCartSerializer, SubscribeSerializer,
-                          SubscribeUserSerializer, TagSerializer)
+from .cache import (INGREDIENTS_VERSION, RECIPE_CACHE_TIMEOUT, TAGS_VERSION,
+                    get_recipe_detail_key, get_recipe_list_key)
+from .db_router import use_primary
+from .fieldsets import FieldSet
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .metrics import registry, timed_data
+from .mixins import (ReplicaReadMixin, SerializerTimingMixin,
+                     VersionedETagMixin)
+from .pantry_index import PANTRY_SEARCH_LIMIT, pantry_index
+from .pagination import CustomPagination, KeysetPagination
+from .permissions import AuthorOrAdminOrReadOnly, IsAdmin
+from .serializers import (BulkRecipesSerializer, FavoriteSerializer,
+                          IngredientSerializer,
+                          PantryRecipeSerializer, RecipeReadSerializer,
+                          RecipeWriteSerializer,
+                          ShoppingCartSerializer,
+                          SubscribeFavoriteRecipeSerializer,
+                          SubscribeUserSerializer, TagSerializer,
+                          get_recipes_limit)
+from .shopping_cart import (SHOPPING_CART_DEFAULT_FORMAT,
+                            SHOPPING_CART_FORMATS)
+
+
+SIMILAR_RECIPES_LIMIT = 10
+PANTRY_MAX_LIMIT = 100
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, VersionedETagMixin,
+                 SerializerTimingMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для модели тегов."""
 
+    version_key = TAGS_VERSION
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, VersionedETagMixin,
+                        SerializerTimingMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет для модели ингредиентов."""
 
+    version_key = INGREDIENTS_VERSION
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('name'):
+            return self.conditional_response(self.search, request)
+        return super().list(request, *args, **kwargs)
+
+    def search(self, request):
+        return Response(
+            ingredient_index.search(request.query_params['name']))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ReplicaReadMixin, SerializerTimingMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для модели рецептов."""
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeReadSerializer
     permission_classes = (AuthorOrAdminOrReadOnly,)
     pagination_class = CustomPagination
+    keyset_ordering = ('-pub_date', '-id')
+    keyset_conflicting_params = ('search',)
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """Рецепты с данными для сериализатора.
+
+        Связи и аннотации полей, исключенных через ?fields= и ?omit=,
+        не загружаются.
+        """
+        user = self.request.user
+        fieldset = FieldSet.from_request(self.request)
+        queryset = Recipe.objects.all()
+        if 'tags' in fieldset:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in fieldset:
+            queryset = queryset.prefetch_related(Prefetch(
+                'recipe_to_ingredient',
+                queryset=RecipeIngredientAmount.objects.select_related(
+                    'ingredient')))
+        if 'text' not in fieldset:
+            queryset = queryset.defer('text')
+        if user.is_authenticated:
+            if 'is_favorited' in fieldset:
+                queryset = queryset.annotate(is_favorited=Exists(
+                    Favorite.objects.filter(
+                        user=user, recipe=OuterRef('pk'))))
+            if 'is_in_shopping_cart' in fieldset:
+                queryset = queryset.annotate(is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef('pk'))))
+        if 'author' not in fieldset:
+            return queryset
+        authors = User.objects.all()
+        if (user.is_authenticated and
+                'is_subscribed' in fieldset.nested('author')):
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(
+                    follower=user, following=OuterRef('pk'))))
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors))
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(
+            get_recipe_list_key(request),
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(
+            get_recipe_detail_key(request, kwargs['pk']),
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, key, view, request, *args, **kwargs):
+        """Отдает ответ анонимному пользователю из кеша, если он там есть."""
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        with use_primary():
+            response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, RECIPE_CACHE_TIMEOUT)
+        return response
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -67,7 +170,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if self.request.method == 'POST':
             serializer.is_valid(raise_exception=True)
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(
+                timed_data(serializer), status=status.HTTP_201_CREATED)
         if model.objects.filter(user=user, recipe=recipe).exists():
             model.objects.get(user=user, recipe=recipe).delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -89,36 +193,103 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.post_delete_for_actions(
             model=ShoppingCart, serializer=ShoppingCartSerializer, pk=pk)
 
+    def bulk_for_actions(self, model):
+        serializer = BulkRecipesSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if self.request.method == 'POST':
+            results = bulk_add(model, self.request.user, recipe_ids)
+        else:
+            results = bulk_remove(model, self.request.user, recipe_ids)
+        return Response({'results': results})
+
+    @action(methods=['POST', 'DELETE'], detail=False, url_path='favorite',
+            url_name='favorite-bulk', permission_classes=(IsAuthenticated,))
+    def bulk_favorite(self, request):
+        return self.bulk_for_actions(Favorite)
+
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='shopping_cart', url_name='shopping-cart-bulk',
+            permission_classes=(IsAuthenticated,))
+    def bulk_shopping_cart(self, request):
+        return self.bulk_for_actions(ShoppingCart)
+
+    @action(methods=['GET'], detail=False,
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        queryset = self.get_queryset().filter(
+            feed_entries__user=request.user).annotate(
+                feed_pub_date=F('feed_entries__pub_date'),
+                feed_entry_id=F('feed_entries__id'))
+        self.keyset_ordering = ('-feed_pub_date', '-feed_entry_id')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(timed_data(serializer))
+
+    @action(methods=['GET'], detail=False)
+    def pantry(self, request):
+        try:
+            ingredient_ids = {
+                int(pk) for value in request.query_params.getlist(
+                    'ingredients') for pk in value.split(',') if pk}
+        except ValueError:
+            return Response(
+                {'errors': 'Ингредиенты передаются списком id!'},
+                status=status.HTTP_400_BAD_REQUEST)
+        limit = min(
+            get_recipes_limit(request, 'limit') or PANTRY_SEARCH_LIMIT,
+            PANTRY_MAX_LIMIT)
+        matches = pantry_index.search(ingredient_ids, limit)
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, *_ in matches])
+        page = []
+        for recipe_id, coverage, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.coverage = coverage
+                recipe.missing_ingredients = missing
+                page.append(recipe)
+        serializer = PantryRecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return Response(timed_data(serializer))
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk):
+        recipes = Recipe.objects.filter(
+            neighbour_of__recipe_id=pk).order_by(
+                '-neighbour_of__score')[:SIMILAR_RECIPES_LIMIT]
+        serializer = SubscribeFavoriteRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context())
+        return Response(timed_data(serializer))
+
     @action(methods=['GET'], detail=False,
             permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        ingredient_list = request.user.shopping_cart.all().values_list(
-            'recipe__recipe_to_ingredient__ingredient',).annotate(
-                amount=Sum('recipe__recipe_to_ingredient__amount'))
-        shopping_cart = {}
-        for ingredient_amount in ingredient_list:
-            ingredient = get_object_or_404(Ingredient, id=ingredient_amount[0])
-            amount = ingredient_amount[1]
-            name_in_shopping_cart = (
-                f'{ingredient.name}'
-                f'({ingredient.measurement_unit})')
-            if shopping_cart.get(name_in_shopping_cart):
-                shopping_cart[name_in_shopping_cart] = (
-                    shopping_cart[name_in_shopping_cart] + amount)
-            else:
-                shopping_cart[name_in_shopping_cart] = amount
-        if len(shopping_cart.keys()) == 0:
+        file_format = request.query_params.get(
+            'file_format', SHOPPING_CART_DEFAULT_FORMAT)
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                {'errors': 'Неподдерживаемый формат файла. Доступные '
+                 f'форматы: {", ".join(SHOPPING_CART_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        rows = ShoppingListItem.objects.filter(
+            user=request.user).values_list(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'amount').order_by(
+                    'ingredient__name', 'ingredient__measurement_unit'
+                ).iterator()
+        first_row = next(rows, None)
+        if first_row is None:
             return Response({'errors': 'Невозможно скачать список покупок'
                              'так как он пуст!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        file_name = 'shopping_cart_to_download'
-        lines = []
-        for ingredient in shopping_cart.keys():
-            lines.append(f'- {ingredient} - {shopping_cart[ingredient]}')
-        response_content = '\n'.join(lines)
-        response = HttpResponse(
-            response_content, content_type="text/plain, charset=utf8")
-        response['Content-Disposition'] = f'attachment; filename={file_name}'
+        render, content_type, extension = SHOPPING_CART_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            render(chain((first_row,), rows)), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_cart_to_download.{extension}')
         return response
 
 
@@ -141,8 +312,9 @@ def subscribe(request, pk):
                 {'errors': 'Невозможно подписаться на самого себя!'},
                 status=status.HTTP_400_BAD_REQUEST)
         Follow.objects.create(follower=follower, following=following)
+        following.refresh_from_db(fields=('followers_count',))
         return Response(
-            SubscribeUserSerializer(following, context=context).data,
+            timed_data(SubscribeUserSerializer(following, context=context)),
             status=status.HTTP_201_CREATED)
     if Follow.objects.filter(follower=follower, following=following).exists():
         Follow.objects.get(follower=follower, following=following).delete()
@@ -153,13 +325,51 @@ def subscribe(request, pk):
         status=status.HTTP_400_BAD_REQUEST)
 
 
-class SubscribtionsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class SubscribtionsViewSet(ReplicaReadMixin, mixins.ListModelMixin,
+                           viewsets.GenericViewSet):
     """Кастомный Вьюсет для Get-запроса к подпискам."""
 
-    serializer_class = SubscribeSerializer
+    serializer_class = SubscribeUserSerializer
     permission_classes = (IsAuthenticated,)
     pagination_class = CustomPagination
+    keyset_ordering = ('subscription_id',)
 
     def get_queryset(self):
-        user = self.request.user
-        return user.followings.all()
+        return User.objects.filter(
+            followers__follower=self.request.user).annotate(
+                subscription_id=F('followers__id')).order_by(
+                    'subscription_id')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        authors = page if page is not None else list(self.get_queryset())
+        if 'recipes' in FieldSet.from_request(request):
+            self.attach_recipes(authors)
+        serializer = self.get_serializer(authors, many=True)
+        if page is not None:
+            return self.get_paginated_response(timed_data(serializer))
+        return Response(timed_data(serializer))
+
+    def attach_recipes(self, authors):
+        """Загружает рецепты всех авторов страницы одним запросом.
+
+        При заданном recipes_limit для каждого автора выбираются только
+        первые N рецептов коррелированным подзапросом с LIMIT.
+        """
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'processed_image', 'cooking_time',
+            'author_id', 'pub_date').order_by('-pub_date', '-id')
+        limit = get_recipes_limit(self.request)
+        if limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(Recipe.objects.filter(
+                author_id=OuterRef('author_id')).order_by(
+                    '-pub_date', '-id').values('pk')[:limit]))
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=recipes, to_attr='limited_recipes'))
+
+
+@api_view(['GET'])
+@permission_classes((IsAdmin,))
+def metrics(request):
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4')
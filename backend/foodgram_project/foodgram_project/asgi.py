@@ -0,0 +1,11 @@
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_project.settings')
+
+wsgi_application = get_wsgi_application()
+
+from api.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler(wsgi_application)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -30,6 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ServerTimingMiddleware',
+    'api.db_router.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,6 +61,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram_project.wsgi.application'
 
+TEST_RUNNER = 'foodgram_project.test_runner.TestRunner'
+
 
 DATABASES = {
     'default': {
@@ -70,6 +75,54 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: список хостов через запятую. Для SQLite хост
+# не используется, поэтому DB_REPLICA_HOSTS=local дает второй алиас
+# к тому же файлу для локальной проверки.
+for number, host in enumerate(
+        host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host):
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    # Версии данных читают все процессы: воркеры сервера и команды
+    # manage.py. Поэтому по умолчанию они хранятся в файлах, а не
+    # в памяти процесса.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram-versions')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+RECIPE_CACHE_TIMEOUT = 60 * 10
+
+CATALOG_CACHE_MAX_AGE = 60
+
+TOKEN_CACHE_SIZE = 1024
+
+TOKEN_CACHE_TTL = 60
+
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='0') == '1'
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='1') == '1'
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -103,16 +156,21 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.getenv(
+    'MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -0,0 +1,26 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов без фоновых пулов потоков и без записи в MEDIA_ROOT.
+
+    Задачи пула продолжали бы работать после завершения теста, поэтому
+    они выполняются сразу после фиксации транзакции. Загруженные файлы
+    сохраняются во временный каталог, который удаляется после тестов.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            BACKGROUND_TASKS_SYNC=True, MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
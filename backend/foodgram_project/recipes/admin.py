@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import (Favorite, Follow, Ingredient, Recipe,
-                     RecipeIngredientAmount, RecipeTag, ShoppingCart, Tag)
+from .models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                     RecipeIngredientAmount, RecipeNeighbour, RecipeTag,
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 class RecipeIngredientAmountInLine(admin.TabularInline):
@@ -24,10 +25,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientAmountInLine, RecipetagInLine)
     list_display = (
         'text', 'name', 'cooking_time', 'author',
-        'image', 'pub_date', 'favorite_count')
-
-    def favorite_count(self, obj):
-        return obj.favorite_recipes.count()
+        'image', 'pub_date', 'favorites_count')
 
 
 @admin.register(Ingredient)
@@ -45,3 +43,6 @@ admin.site.register(RecipeTag)
 admin.site.register(ShoppingCart)
 admin.site.register(Favorite)
 admin.site.register(Follow)
+admin.site.register(FeedEntry)
+admin.site.register(RecipeNeighbour)
+admin.site.register(ShoppingListItem)
@@ -1,5 +1,55 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from .counters import COUNTERS, make_handlers
+        from .feed import follow_created, follow_deleted, recipe_created
+        from .images import schedule_image_processing
+        from .models import (Follow, Recipe, RecipeIngredientAmount,
+                             ShoppingCart)
+        from .search import delete_fts_row, update_search_row
+        from .shopping_list import (recipe_deleting,
+                                    recipe_ingredient_changed,
+                                    shopping_cart_changed)
+        from .similarity import neighbour_deleting
+
+        post_save.connect(
+            schedule_image_processing, sender=Recipe,
+            dispatch_uid='recipe_image_processing')
+        post_save.connect(
+            update_search_row, sender=Recipe,
+            dispatch_uid='recipe_search_update')
+        post_delete.connect(
+            delete_fts_row, sender=Recipe, dispatch_uid='recipe_fts_delete')
+        post_save.connect(
+            recipe_created, sender=Recipe, dispatch_uid='feed_fan_out')
+        post_save.connect(
+            follow_created, sender=Follow, dispatch_uid='feed_backfill')
+        post_delete.connect(
+            follow_deleted, sender=Follow, dispatch_uid='feed_unfollow')
+        pre_delete.connect(
+            recipe_deleting, sender=Recipe,
+            dispatch_uid='shopping_list_recipe_delete')
+        pre_delete.connect(
+            neighbour_deleting, sender=Recipe,
+            dispatch_uid='similarity_neighbour_delete')
+        for signal in (post_save, post_delete):
+            signal.connect(
+                shopping_cart_changed, sender=ShoppingCart,
+                dispatch_uid=f'shopping_list_cart_{signal is post_save}')
+            signal.connect(
+                recipe_ingredient_changed, sender=RecipeIngredientAmount,
+                dispatch_uid=f'shopping_list_amount_{signal is post_save}')
+
+        for model, field, relation, relation_field in COUNTERS:
+            increment, decrement = make_handlers(model, field, relation_field)
+            post_save.connect(
+                increment, sender=relation, weak=False,
+                dispatch_uid=f'{field}_increment')
+            post_delete.connect(
+                decrement, sender=relation, weak=False,
+                dispatch_uid=f'{field}_decrement')
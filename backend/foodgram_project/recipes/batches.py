@@ -0,0 +1,44 @@
+"""Изменения, которые копятся в транзакции и применяются после фиксации.
+
+Каскадное удаление и массовые операции отправляют сигнал для каждой
+строки. Обработчики складывают изменения в пакет текущей транзакции,
+а после фиксации пакет применяется один раз. Вне транзакции пакет
+применяется сразу.
+"""
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+local = threading.local()
+
+
+def add_to_batch(name, update, flush, using=DEFAULT_DB_ALIAS):
+    """Добавляет изменения в пакет name.
+
+    update(batch) добавляет изменения в словарь пакета, flush(batch)
+    применяет пакет. Для каждой точки сохранения заводится свой пакет,
+    поэтому при ее откате вместе с ней отменяются и ее изменения.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        batch = {}
+        update(batch)
+        flush(batch)
+        return
+    batches = local.__dict__.setdefault('batches', {})
+    key = (name, using, tuple(connection.savepoint_ids))
+    entry = batches.get(key)
+    # После отката транзакции обработчик снят, а пакет остался: такой
+    # пакет отбрасывается.
+    if entry is None or not any(
+            func is entry[1] for _, func in connection.run_on_commit):
+        batch = {}
+
+        def run():
+            if batches.get(key) is entry:
+                del batches[key]
+            flush(batch)
+
+        entry = batches[key] = (batch, run)
+        transaction.on_commit(run, using=using)
+    update(entry[0])
@@ -0,0 +1,80 @@
+"""Массовое добавление рецептов в избранное и список покупок.
+
+Добавление выполняется одной вставкой без сигналов моделей, поэтому
+счетчики рецептов и агрегированный список покупок обновляются здесь же.
+Удаление идет через delete() и обычные обработчики сигналов, которые
+копят изменения транзакции и применяют их одним запросом.
+"""
+from django.db import IntegrityError, transaction
+
+from .counters import change_counters, get_counter_field
+from .models import Recipe, ShoppingCart
+from .shopping_list import cart_changed
+
+INSERT_ATTEMPTS = 3
+
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+
+
+def get_outcomes(recipe_ids, groups):
+    """Статус каждого id в порядке запроса."""
+    statuses = {}
+    for outcome, ids in groups.items():
+        statuses.update(dict.fromkeys(ids, outcome))
+    return [{'id': recipe_id, 'status': statuses[recipe_id]}
+            for recipe_id in recipe_ids]
+
+
+@transaction.atomic
+def bulk_add(model, user, recipe_ids):
+    """Добавляет рецепты пользователю одной вставкой.
+
+    Если параллельный запрос успел добавить часть рецептов, вставка
+    откатывается до точки сохранения и повторяется без них, так что
+    счетчики увеличиваются только для действительно вставленных строк.
+    """
+    existing = set(Recipe.objects.filter(
+        id__in=recipe_ids).values_list('id', flat=True))
+    for attempt in range(INSERT_ATTEMPTS):
+        already_added = set(model.objects.filter(
+            user=user, recipe_id__in=existing).values_list(
+                'recipe_id', flat=True))
+        added = existing - already_added
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    [model(user=user, recipe_id=recipe_id)
+                     for recipe_id in added])
+            break
+        except IntegrityError:
+            if attempt == INSERT_ATTEMPTS - 1:
+                raise
+    change_counters(Recipe, get_counter_field(Recipe, model), added, 1)
+    if model is ShoppingCart:
+        cart_changed(user.id, added)
+    return get_outcomes(recipe_ids, {
+        ADDED: added,
+        ALREADY_ADDED: already_added,
+        NOT_FOUND: set(recipe_ids) - existing,
+    })
+
+
+@transaction.atomic
+def bulk_remove(model, user, recipe_ids):
+    """Удаляет рецепты пользователя.
+
+    Счетчики и список покупок обновляют обработчики post_delete, как
+    и при удалении по одному.
+    """
+    rows = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+    removed = set(rows.select_for_update().values_list(
+        'recipe_id', flat=True))
+    rows.delete()
+    return get_outcomes(recipe_ids, {
+        REMOVED: removed,
+        NOT_ADDED: set(recipe_ids) - removed,
+    })
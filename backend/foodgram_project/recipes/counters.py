@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+
+from users.models import User
+from .batches import add_to_batch
+from .models import Favorite, Follow, Recipe, ShoppingCart
+
+# Счетчик: модель-владелец, поле счетчика, модель связи и поле связи,
+# указывающее на владельца.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+# Отправляется после изменения счетчика field у объектов pks.
+counters_changed = Signal()
+
+
+def get_changed_value(field, delta):
+    """Новое значение счетчика; при уменьшении не ниже нуля.
+
+    Два параллельных удаления одной связи иначе увели бы
+    PositiveIntegerField ниже нуля.
+    """
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_counter(model, field, pk, delta):
+    """Изменяет счетчик после фиксации транзакции.
+
+    Изменения одной транзакции копятся и применяются через
+    change_counters одним UPDATE на каждое значение суммарного delta.
+    """
+    def update(batch):
+        deltas = batch.setdefault((model, field), defaultdict(int))
+        deltas[pk] += delta
+
+    add_to_batch('counters', update, apply_counter_changes)
+
+
+def apply_counter_changes(batch):
+    for (model, field), deltas in batch.items():
+        pks_by_delta = defaultdict(list)
+        for pk, delta in deltas.items():
+            if delta:
+                pks_by_delta[delta].append(pk)
+        for delta, pks in pks_by_delta.items():
+            change_counters(model, field, pks, delta)
+
+
+def get_count_subquery(relation, relation_field):
+    return Coalesce(Subquery(
+        relation.objects.filter(**{relation_field: OuterRef('pk')}).order_by(
+        ).values(relation_field).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()), 0)
+
+
+def make_handlers(model, field, relation_field):
+    def increment(sender, instance, created, **kwargs):
+        if created:
+            change_counter(
+                model, field, getattr(instance, f'{relation_field}_id'), 1)
+
+    def decrement(sender, instance, **kwargs):
+        change_counter(
+            model, field, getattr(instance, f'{relation_field}_id'), -1)
+
+    return increment, decrement
+
+
+def recount(model, field, relation, relation_field, batch_size):
+    """Сверяет счетчик с фактическим числом связей и исправляет расхождения.
+
+    Возвращает количество исправленных строк.
+    """
+    repaired = 0
+    last_pk = 0
+    while True:
+        batch = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').annotate(actual=get_count_subquery(
+                relation, relation_field)).only('pk', field)[:batch_size])
+        if not batch:
+            return repaired
+        changed = []
+        for obj in batch:
+            if getattr(obj, field) != obj.actual:
+                setattr(obj, field, obj.actual)
+                changed.append(obj)
+        if changed:
+            model.objects.bulk_update(changed, (field,))
+            repaired += len(changed)
+        last_pk = batch[-1].pk
+
+
+def change_counters(model, field, pks, delta):
+    """Изменяет счетчик сразу у нескольких объектов одним UPDATE."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: get_changed_value(field, delta)})
+        counters_changed.send(sender=model, field=field, pks=pks)
+
+
+def get_counter_field(owner, relation):
+    """Поле счетчика владельца owner, считающего связи relation."""
+    for model, field, relation_model, relation_field in COUNTERS:
+        if model is owner and relation_model is relation:
+            return field
+    raise LookupError(f'Нет счетчика {relation.__name__} у {owner.__name__}')
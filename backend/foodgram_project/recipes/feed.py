@@ -0,0 +1,102 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import FeedEntry, Follow, Recipe
+
+logger = logging.getLogger(__name__)
+
+FEED_BATCH_SIZE = getattr(settings, 'FEED_BATCH_SIZE', 1000)
+FEED_BACKFILL_SIZE = getattr(settings, 'FEED_BACKFILL_SIZE', 100)
+FEED_WORKERS = getattr(settings, 'FEED_WORKERS', 1)
+
+executor = ThreadPoolExecutor(
+    max_workers=FEED_WORKERS, thread_name_prefix='feed')
+
+
+def run_in_background(function, *args):
+    """Запускает задачу в пуле после фиксации текущей транзакции.
+
+    При настройке BACKGROUND_TASKS_SYNC задача выполняется сразу после
+    фиксации в текущем потоке.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_SYNC', False):
+        transaction.on_commit(lambda: function(*args))
+        return
+
+    def task():
+        close_old_connections()
+        try:
+            function(*args)
+        except Exception:
+            logger.exception('Ошибка при обновлении ленты подписок')
+        finally:
+            close_old_connections()
+    transaction.on_commit(lambda: executor.submit(task))
+
+
+def fan_out_recipe(recipe_id):
+    """Добавляет рецепт в ленты всех подписчиков автора пачками."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date').first()
+    if recipe is None:
+        return
+    followers = Follow.objects.filter(
+        following_id=recipe['author_id']).order_by('follower_id').values_list(
+            'follower_id', flat=True)
+    last_follower_id = 0
+    while True:
+        # Подписки пачки блокируются до вставки, чтобы отписка не прошла
+        # между чтением подписчиков и добавлением записей в их ленты.
+        with transaction.atomic():
+            batch = list(followers.filter(
+                follower_id__gt=last_follower_id).select_for_update()[
+                    :FEED_BATCH_SIZE])
+            if not batch:
+                return
+            FeedEntry.objects.bulk_create(
+                [FeedEntry(user_id=follower_id, recipe_id=recipe_id,
+                           pub_date=recipe['pub_date'])
+                 for follower_id in batch],
+                ignore_conflicts=True)
+        last_follower_id = batch[-1]
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора после подписки.
+
+    Задача выполняется позже подписки: если к этому времени пользователь
+    отписался, лента не меняется. Подписка блокируется до вставки, так что
+    отписка дождется ее и удалит добавленные записи.
+    """
+    with transaction.atomic():
+        follow = Follow.objects.filter(
+            follower_id=user_id, following_id=author_id)
+        if not follow.select_for_update().exists():
+            return
+        recipes = Recipe.objects.filter(author_id=author_id).values_list(
+            'id', 'pub_date')[:FEED_BACKFILL_SIZE]
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       pub_date=pub_date)
+             for recipe_id, pub_date in recipes],
+            ignore_conflicts=True)
+
+
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        run_in_background(fan_out_recipe, instance.pk)
+
+
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        run_in_background(
+            backfill_feed, instance.follower_id, instance.following_id)
+
+
+def follow_deleted(sender, instance, **kwargs):
+    FeedEntry.objects.filter(
+        user_id=instance.follower_id,
+        recipe__author_id=instance.following_id).delete()
@@ -0,0 +1,106 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANTS = getattr(settings, 'RECIPE_IMAGE_VARIANTS', {
+    'display': (1280, 1280),
+    'thumbnail': (400, 400),
+})
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+IMAGE_WORKERS = getattr(settings, 'RECIPE_IMAGE_WORKERS', 2)
+
+# Отправляется с recipe_id, когда варианты изображения рецепта готовы.
+# processed_image сохраняется через update(), без post_save.
+image_processed = Signal()
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='recipe-images')
+
+
+def get_variant_name(image_name, variant, image_format):
+    """Путь к варианту изображения рядом с исходным файлом."""
+    directory, file_name = os.path.split(image_name)
+    stem = os.path.splitext(file_name)[0]
+    extension = 'jpg' if image_format == 'jpeg' else image_format
+    return os.path.join(
+        directory, 'variants', f'{stem}_{variant}.{extension}')
+
+
+def render_variants(source):
+    """Возвращает уменьшенные копии изображения во всех форматах."""
+    image = ImageOps.exif_transpose(Image.open(source))
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for image_format, (pil_format, options) in IMAGE_FORMATS.items():
+            converted = resized
+            if pil_format == 'JPEG' and resized.mode != 'RGB':
+                converted = resized.convert('RGB')
+            elif resized.mode not in ('RGB', 'RGBA'):
+                converted = resized.convert('RGBA')
+            buffer = BytesIO()
+            converted.save(buffer, pil_format, **options)
+            yield variant, image_format, buffer.getvalue()
+
+
+def process_recipe_image(recipe_id, image_name):
+    """Создает варианты изображения рецепта и отмечает их готовность.
+
+    Возвращает True, если варианты созданы для текущего изображения.
+    """
+    from .models import Recipe
+
+    close_old_connections()
+    processed = False
+    try:
+        with default_storage.open(image_name) as source:
+            for variant, image_format, content in render_variants(source):
+                name = get_variant_name(image_name, variant, image_format)
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(content))
+        processed = bool(Recipe.objects.filter(
+            pk=recipe_id, image=image_name).update(
+                processed_image=image_name))
+        if processed:
+            image_processed.send(sender=Recipe, recipe_id=recipe_id)
+    except FileNotFoundError:
+        # Рецепт могли удалить или сменить изображение до обработки.
+        logger.warning(
+            'Нет файла %s изображения рецепта %s', image_name, recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение рецепта %s', recipe_id)
+    finally:
+        close_old_connections()
+    return processed
+
+
+def schedule_image_processing(sender, instance, **kwargs):
+    """Ставит обработку нового изображения рецепта в очередь пула.
+
+    При настройке BACKGROUND_TASKS_SYNC изображение обрабатывается сразу
+    после фиксации транзакции в текущем потоке; так работают тесты.
+    """
+    image_name = instance.image.name
+    if not image_name or instance.processed_image == image_name:
+        return
+    if getattr(settings, 'BACKGROUND_TASKS_SYNC', False):
+        transaction.on_commit(
+            lambda: process_recipe_image(instance.pk, image_name))
+    else:
+        transaction.on_commit(lambda: executor.submit(
+            process_recipe_image, instance.pk, image_name))
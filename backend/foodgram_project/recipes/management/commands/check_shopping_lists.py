@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from recipes.shopping_list import check_items
+
+
+class Command(BaseCommand):
+    """Команда для сверки агрегированных списков покупок с пересчетом."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересчитать списки пользователей с расхождениями')
+
+    def handle(self, *args, **options):
+        broken = check_items(options['batch_size'], options['fix'])
+        if not broken:
+            self.stdout.write('Расхождений нет')
+            return
+        self.stdout.write(
+            f'Расхождения у {len(broken)} пользователей: '
+            f'{", ".join(map(str, broken))}')
+        if options['fix']:
+            self.stdout.write('Списки пересчитаны')
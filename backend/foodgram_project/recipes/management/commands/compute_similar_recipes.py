@@ -0,0 +1,28 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.similarity import compute_neighbours
+
+
+class Command(BaseCommand):
+    """Команда для расчета похожих рецептов.
+
+    По умолчанию пересчитываются только рецепты, изменившиеся после
+    прошлого запуска, с --full пересчитываются все.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true')
+        parser.add_argument('--top-k', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=256)
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        count = compute_neighbours(
+            top_k=options['top_k'], chunk_size=options['chunk_size'],
+            workers=options['workers'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {count}, '
+            f'время {time.monotonic() - started_at:.2f} с'))
@@ -1,22 +1,98 @@
+import json
+import os
+import time
 from csv import DictReader
+from itertools import islice
 
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
 
+from api.cache import INGREDIENTS_VERSION, bump_version
 from recipes.models import Ingredient
 
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, '..', '..', 'data', 'ingredients.csv')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for item in DictReader(file):
+        yield item
+
+
+def read_json(file):
+    """Построчно разбирает json-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается json-массив объектов')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError('Некорректный json-файл')
+            return
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
 
 class Command(BaseCommand):
-    """Команда для импорта данных из csv файла в базу данных."""
-
-    def handle(self, *args, **kwargs):
-        with open(
-            '../../data/ingredients.csv',
-            'r', encoding='utf-8'
-        ) as csv_file:
-            reader = DictReader(csv_file)
-            print('Загрузка данных из ingredients.csv')
-            for item in reader:
-                Ingredient.objects.create(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit'])
-            print('Данные успешно загружены в базу данных')
+    """Команда для импорта ингредиентов из csv или json файла в базу данных.
+
+    Ингредиенты добавляются пачками, уже существующие пары
+    (название, единица измерения) пропускаются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только csv и json файлы')
+        started_at = time.monotonic()
+        count_before = Ingredient.objects.count()
+        total = 0
+        self.stdout.write(f'Загрузка данных из {os.path.basename(path)}')
+        with open(path, 'r', encoding='utf-8') as file:
+            items = reader(file)
+            while True:
+                batch = [
+                    Ingredient(
+                        name=item['name'],
+                        measurement_unit=item['measurement_unit'])
+                    for item in islice(items, options['batch_size'])]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+        inserted = Ingredient.objects.count() - count_before
+        if inserted:
+            bump_version(INGREDIENTS_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные успешно загружены в базу данных: добавлено {inserted}, '
+            f'пропущено {total - inserted}, '
+            f'время {time.monotonic() - started_at:.2f} с'))
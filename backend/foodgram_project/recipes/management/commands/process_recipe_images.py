@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+from django.db.models import F
+
+from recipes.images import executor, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Команда для создания вариантов изображений уже загруженных рецептов.
+
+    По умолчанию обрабатываются рецепты, у которых варианты еще не
+    созданы, с --all — все рецепты с изображением.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.exclude(processed_image=F('image'))
+        recipes = list(recipes.order_by('id').values_list('id', 'image'))
+        processed = sum(executor.map(
+            lambda recipe: process_recipe_image(*recipe), recipes))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed} из {len(recipes)}'))
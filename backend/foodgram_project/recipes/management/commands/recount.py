@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    """Команда для пересчета денормализованных счетчиков."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model, field, relation, relation_field in COUNTERS:
+            repaired = recount(
+                model, field, relation, relation_field,
+                options['batch_size'])
+            self.stdout.write(
+                f'{model.__name__}.{field}: исправлено {repaired}')
@@ -0,0 +1,196 @@
+import io
+import random
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, call_command
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from api.cache import (INGREDIENTS_VERSION, PANTRY_VERSION, RECIPES_VERSION,
+                       RELATED_VERSION, TAGS_VERSION, bump_version)
+from recipes.feed import FEED_BACKFILL_SIZE
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                            RecipeIngredientAmount, RecipeTag, ShoppingCart,
+                            Tag)
+from recipes.search import fill_search_index
+from recipes.shopping_list import check_items
+from users.models import User
+
+IMAGE_NAME = 'recipes/benchmark.png'
+PASSWORD = 'benchmark-password'
+TAG_COLORS = (
+    '#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2D9CDB', '#EB5757',
+    '#6FCF97', '#BB6BD9')
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'паста', 'омлет', 'каша', 'запеканка',
+    'курица', 'говядина', 'грибы', 'сыр', 'томаты', 'картофель', 'рис',
+    'домашний', 'быстрый', 'острый', 'сливочный', 'летний', 'овощной')
+
+
+def get_image():
+    """Одно общее изображение для всех сгенерированных рецептов."""
+    if not default_storage.exists(IMAGE_NAME):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (226, 108, 45)).save(buffer, 'PNG')
+        default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+    return IMAGE_NAME
+
+
+class Command(BaseCommand):
+    """Команда для генерации синтетических данных для нагрузочных замеров.
+
+    Все объекты создаются через bulk_create без сигналов, поэтому в конце
+    отдельно заполняются счетчики, ленты подписок, агрегированные списки
+    покупок и полнотекстовый индекс, а версии кеша сбрасываются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument('--max-tags', type=int, default=3)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Рецептов в списке покупок пользователя')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started_at = time.monotonic()
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients_data', stdout=self.stdout)
+        with transaction.atomic():
+            tag_ids = self.create_tags(options['tags'])
+            user_ids = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                options['recipes'], user_ids, tag_ids, options)
+            follows = self.create_relations(
+                Follow, 'follower_id', 'following_id', user_ids, user_ids,
+                options['follows'])
+            self.create_relations(
+                Favorite, 'user_id', 'recipe_id', user_ids, recipes,
+                options['favorites'])
+            self.create_relations(
+                ShoppingCart, 'user_id', 'recipe_id', user_ids, recipes,
+                options['cart'])
+            self.create_feed(follows)
+        self.stdout.write('Пересчет производных данных')
+        call_command('recount', stdout=self.stdout)
+        check_items(fix=True)
+        for key in (RECIPES_VERSION, RELATED_VERSION, TAGS_VERSION,
+                    INGREDIENTS_VERSION, PANTRY_VERSION):
+            bump_version(key)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей {len(user_ids)}, рецептов '
+            f'{len(recipes)}, время {time.monotonic() - started_at:.1f} с'))
+
+    def bulk_create(self, model, objects, ignore_conflicts=True):
+        # Пачки режутся вручную: явный batch_size в bulk_create отключает
+        # ограничение SQLite на число параметров запроса.
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size],
+                ignore_conflicts=ignore_conflicts)
+
+    def create_new(self, model, objects):
+        """Создает объекты и возвращает их id (bulk_create на SQLite
+        id не возвращает)."""
+        last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        self.bulk_create(model, objects, ignore_conflicts=False)
+        return list(model.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def create_tags(self, count):
+        existing = Tag.objects.count()
+        self.bulk_create(Tag, [
+            Tag(name=f'Тег {number}', slug=f'tag-{number}',
+                color=TAG_COLORS[number % len(TAG_COLORS)] if
+                number < len(TAG_COLORS) else f'#{number:06X}')
+            for number in range(existing, count)])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        offset = User.objects.count()
+        self.stdout.write(f'Пользователи: {count}')
+        return self.create_new(User, [
+            User(username=f'bench{number}',
+                 email=f'bench{number}@example.com',
+                 first_name='Бенчмарк', last_name=str(number),
+                 password=password)
+            for number in range(offset, offset + count)])
+
+    def create_recipes(self, count, user_ids, tag_ids, options):
+        self.stdout.write(f'Рецепты: {count}')
+        image = get_image()
+        words = self.random.choices
+        recipe_ids = self.create_new(Recipe, [
+            Recipe(name=' '.join(words(WORDS, k=3)).capitalize(),
+                   text=' '.join(words(WORDS, k=30)),
+                   cooking_time=self.random.randint(5, 180),
+                   author_id=self.random.choice(user_ids), image=image)
+            for _ in range(count)])
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        amounts, tags = [], []
+        for recipe_id in recipe_ids:
+            size = self.random.randint(
+                options['min_ingredients'], options['max_ingredients'])
+            amounts.extend(
+                RecipeIngredientAmount(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500))
+                for ingredient_id in self.random.sample(
+                    ingredient_ids, min(size, len(ingredient_ids))))
+            tags.extend(
+                RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in self.random.sample(tag_ids, min(
+                    self.random.randint(1, options['max_tags']),
+                    len(tag_ids))))
+        self.bulk_create(RecipeIngredientAmount, amounts)
+        self.bulk_create(RecipeTag, tags)
+        if recipe_ids:
+            fill_search_index(recipe_ids[0] - 1)
+        return recipe_ids
+
+    def create_relations(self, model, owner_field, target_field, owner_ids,
+                         target_ids, per_owner):
+        """Случайные связи без повторов; возвращает список пар."""
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {per_owner} '
+                          'на пользователя')
+        pairs = []
+        for owner_id in owner_ids:
+            targets = self.random.sample(
+                target_ids, min(per_owner + 1, len(target_ids)))
+            pairs.extend((owner_id, target_id) for target_id in [
+                target_id for target_id in targets
+                if target_id != owner_id][:per_owner])
+        self.bulk_create(model, [
+            model(**{owner_field: owner_id, target_field: target_id})
+            for owner_id, target_id in pairs])
+        return pairs
+
+    def create_feed(self, follows):
+        """Заполняет ленты подписок, как это сделал бы backfill_feed."""
+        recipes = defaultdict(list)
+        for recipe_id, author_id, pub_date in Recipe.objects.order_by(
+                '-pub_date', '-id').values_list(
+                    'id', 'author_id', 'pub_date').iterator():
+            if len(recipes[author_id]) < FEED_BACKFILL_SIZE:
+                recipes[author_id].append((recipe_id, pub_date))
+        self.bulk_create(FeedEntry, [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+            for user_id, author_id in follows
+            for recipe_id, pub_date in recipes[author_id]])
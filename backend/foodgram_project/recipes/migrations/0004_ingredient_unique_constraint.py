@@ -0,0 +1,65 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Оставляет по одному ингредиенту на пару (name, measurement_unit).
+
+    Ссылки рецептов переводятся на ингредиент с наименьшим id. Если у
+    рецепта оказывается несколько строк с этим ингредиентом, они
+    объединяются в одну с суммарным количеством.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredientAmount = apps.get_model(
+        'recipes', 'RecipeIngredientAmount')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit').annotate(
+            survivor=Min('id'), count=Count('id')).filter(
+                count__gt=1).order_by()
+    for group in groups.iterator():
+        survivor = group['survivor']
+        extra_ids = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']).exclude(
+                id=survivor).values_list('id', flat=True))
+        rows_by_recipe = {}
+        for row in RecipeIngredientAmount.objects.filter(
+                ingredient_id__in=[survivor, *extra_ids]).order_by(
+                    'recipe_id', 'id'):
+            rows_by_recipe.setdefault(row.recipe_id, []).append(row)
+        for rows in rows_by_recipe.values():
+            kept = next(
+                (row for row in rows if row.ingredient_id == survivor),
+                rows[0])
+            others = [row.id for row in rows if row is not kept]
+            if not others and kept.ingredient_id == survivor:
+                continue
+            RecipeIngredientAmount.objects.filter(id__in=others).delete()
+            kept.amount = sum(row.amount for row in rows)
+            kept.ingredient_id = survivor
+            kept.save(update_fields=('ingredient', 'amount'))
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Объединение дублей выполняется в отдельной транзакции: на PostgreSQL
+    # ALTER TABLE нельзя выполнить, пока есть отложенные проверки внешних
+    # ключей от удаленных строк.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0003_auto_20230113_1440'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+            atomic=True),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
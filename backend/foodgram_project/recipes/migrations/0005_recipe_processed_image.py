@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_unique_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='processed_image',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Изображение с готовыми вариантами'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:15
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'in_carts_count', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'Follow', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app_label, model_name, field, relation_name, relation_field in (
+            COUNTERS):
+        model = apps.get_model(app_label, model_name)
+        relation = apps.get_model('recipes', relation_name)
+        model.objects.update(**{field: Coalesce(Subquery(
+            relation.objects.filter(
+                **{relation_field: OuterRef('pk')}).order_by().values(
+                    relation_field).annotate(count=Count('pk')).values(
+                        'count'),
+            output_field=IntegerField()), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+        ('recipes', '0006_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:28
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def fill_computed_at(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeNeighbour = apps.get_model('recipes', 'RecipeNeighbour')
+    Recipe.objects.update(neighbours_computed_at=Subquery(
+        RecipeNeighbour.objects.filter(recipe=OuterRef('pk')).order_by(
+        ).values('recipe').annotate(
+            last=Max('computed_at')).values('last')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='neighbours_computed_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Дата расчета похожих рецептов'),
+        ),
+        migrations.RunPython(fill_computed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:44
+
+from importlib import import_module
+
+import django.contrib.postgres.search
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_CONFIG = 'russian'
+SEARCH_INDEX = GinIndex(
+    fields=['search_vector'], name='recipe_search_vector_idx')
+
+# Колонка, триггер и индекс из 0008 заменяются полем модели.
+search_migration = import_module('recipes.migrations.0008_recipe_search')
+
+
+def drop_trigger(apps, schema_editor):
+    search_migration.run_statements(schema_editor, {
+        'postgresql': search_migration.POSTGRESQL_BACKWARD})
+
+
+def create_trigger(apps, schema_editor):
+    search_migration.run_statements(schema_editor, {
+        'postgresql': search_migration.POSTGRESQL_FORWARD})
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('text', weight='B', config=SEARCH_CONFIG)))
+    schema_editor.add_index(Recipe, SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(
+            apps.get_model('recipes', 'Recipe'), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_neighbours_computed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigger, create_trigger),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,6 +1,7 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
-from users.models import User
+from users.models import CountersMixin, User
 
 
 class Ingredient(models.Model):
@@ -13,6 +14,10 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'),)
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -36,7 +41,14 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeManager(models.Manager):
+    """Поисковый вектор нужен только поиску и не загружается с рецептом."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов."""
 
     text = models.TextField(verbose_name='Описание')
@@ -46,6 +58,9 @@ class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='recipes')
     image = models.ImageField(upload_to='recipes/')
+    processed_image = models.CharField(
+        verbose_name='Изображение с готовыми вариантами',
+        max_length=100, blank=True, editable=False)
     tags = models.ManyToManyField(
         Tag, through='RecipeTag', verbose_name='Теги', related_name='tags')
     ingredients = models.ManyToManyField(
@@ -56,11 +71,28 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации',)
+    modified_at = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name='Дата изменения')
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном', default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок', default=0, editable=False)
+    neighbours_computed_at = models.DateTimeField(
+        verbose_name='Дата расчета похожих рецептов', null=True,
+        editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeManager()
+
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'),)
 
     def __str__(self):
         return f'Рецепт: {self.name}, Автор: {self.author}'
@@ -128,6 +160,29 @@ class ShoppingCart(models.Model):
         return f'Список покупок пользователя {self.user}'
 
 
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок юзера."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        verbose_name='Пользователь', related_name='shopping_list_items')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        verbose_name='Ингредиент', related_name='shopping_list_items')
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'),)
+
+    def __str__(self):
+        return f'{self.ingredient} для пользователя {self.user}'
+
+
 class Favorite(models.Model):
     """Модель избранных рецептов."""
 
@@ -170,3 +225,58 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'Подписки пользоваеля {self.follower}'
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок: рецепт автора, на которого подписан юзер."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        verbose_name='Пользователь', related_name='feed_entries')
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        verbose_name='Рецепт', related_name='feed_entries')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'),)
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-id'),
+                name='feed_user_pub_date_idx'),)
+
+    def __str__(self):
+        return f'Лента пользователя {self.user}'
+
+
+class RecipeNeighbour(models.Model):
+    """Похожий рецепт с оценкой сходства по ингредиентам и тегам."""
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        verbose_name='Рецепт', related_name='neighbours')
+    neighbour = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт', related_name='neighbour_of')
+    score = models.FloatField(verbose_name='Сходство')
+    computed_at = models.DateTimeField(verbose_name='Дата расчета')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'neighbour'),
+                name='unique_recipe_neighbour'),)
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='neighbour_recipe_score_idx'),)
+
+    def __str__(self):
+        return f'Похожие рецепты для {self.recipe}'
@@ -0,0 +1,91 @@
+"""Полнотекстовый поиск по названию и описанию рецептов.
+
+На PostgreSQL используется поле search_vector с GIN-индексом (русская
+морфология, название важнее описания). На SQLite используется отдельная
+таблица FTS5. Оба индекса обновляются сигналами модели Recipe.
+"""
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F
+
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+SEARCH_FIELDS = {'name', 'text'}
+
+
+def get_search_vector():
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('text', weight='B', config=SEARCH_CONFIG))
+
+
+def get_fts_query(query):
+    """Запрос FTS5: каждое слово ищется как префикс (замена стемминга)."""
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по запросу и сортирует их по релевантности."""
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date')
+    if vendor == 'sqlite':
+        fts_query = get_fts_query(query)
+        if not fts_query:
+            return queryset.none()
+        # Ранг берется из соединения с FTS-таблицей за один проход MATCH:
+        # коррелированный подзапрос выполнял бы поиск заново для каждой
+        # найденной строки.
+        return queryset.extra(
+            select={'search_rank': f'-{FTS_TABLE}.rank'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE} MATCH %s',
+                   f"{FTS_TABLE}.rank MATCH 'bm25(10.0, 1.0)'",
+                   f'{FTS_TABLE}.rowid = "recipes_recipe"."id"'],
+            params=[fts_query]).order_by('-search_rank', '-pub_date')
+    return queryset.filter(name__icontains=query)
+
+
+def update_search_row(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk=instance.pk).update(
+            search_vector=get_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (instance.pk,))
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                'VALUES (%s, %s, %s)',
+                (instance.pk, instance.name, instance.text))
+
+
+def delete_fts_row(sender, instance, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (instance.pk,))
+
+
+def fill_search_index(min_id=0):
+    """Индексирует рецепты, созданные через bulk_create."""
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(id__gt=min_id).update(
+            search_vector=get_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                'SELECT id, name, text FROM recipes_recipe WHERE id > %s',
+                (min_id,))
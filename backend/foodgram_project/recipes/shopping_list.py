@@ -0,0 +1,146 @@
+"""Агрегированный список покупок пользователя.
+
+ShoppingListItem хранит сумму каждого ингредиента по рецептам из списка
+покупок. При изменении списка покупок или ингредиентов рецепта
+пересчитываются только затронутые пары (пользователь, ингредиент).
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from .batches import add_to_batch
+from .models import RecipeIngredientAmount, ShoppingCart, ShoppingListItem
+
+
+def get_totals(user_ids=None, ingredient_ids=None):
+    """Суммы ингредиентов по спискам покупок: {(user, ingredient): amount}."""
+    rows = RecipeIngredientAmount.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(recipe__in_shopping_carts__user__in=user_ids)
+    if ingredient_ids is not None:
+        rows = rows.filter(ingredient__in=ingredient_ids)
+    rows = rows.values_list(
+        'recipe__in_shopping_carts__user', 'ingredient').annotate(
+            total=Sum('amount')).order_by()
+    return {(user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows.iterator()
+            if user_id is not None}
+
+
+@transaction.atomic
+def refresh_items(user_ids, ingredient_ids):
+    """Пересчитывает позиции списков для указанных пар."""
+    user_ids, ingredient_ids = set(user_ids), set(ingredient_ids)
+    if not user_ids or not ingredient_ids:
+        return
+    totals = get_totals(user_ids, ingredient_ids)
+    ShoppingListItem.objects.filter(
+        user__in=user_ids, ingredient__in=ingredient_ids).delete()
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+         for (user_id, ingredient_id), amount in totals.items()],
+        ignore_conflicts=True)
+
+
+def schedule_refresh(user_ids=(), ingredient_ids=(), recipe_ids=(),
+                     cart_recipe_ids=()):
+    """Пересчет после фиксации транзакции, когда данные уже записаны.
+
+    Пересчеты одной транзакции объединяются в один. К ингредиентам
+    добавляются ингредиенты рецептов recipe_ids, к пользователям —
+    владельцы списков покупок с рецептами cart_recipe_ids; они
+    определяются при пересчете одним запросом.
+    """
+    def update(batch):
+        for name, ids in (('users', user_ids),
+                          ('ingredients', ingredient_ids),
+                          ('recipes', recipe_ids),
+                          ('cart_recipes', cart_recipe_ids)):
+            batch.setdefault(name, set()).update(ids)
+
+    add_to_batch('shopping_list', update, apply_refresh)
+
+
+def apply_refresh(batch):
+    user_ids, ingredient_ids = batch['users'], batch['ingredients']
+    if batch['recipes']:
+        ingredient_ids |= set(get_recipe_ingredient_ids(batch['recipes']))
+    if batch['cart_recipes']:
+        user_ids |= set(ShoppingCart.objects.filter(
+            recipe__in=batch['cart_recipes']).values_list(
+                'user_id', flat=True))
+    refresh_items(user_ids, ingredient_ids)
+
+
+def get_recipe_ingredient_ids(recipe_ids):
+    return RecipeIngredientAmount.objects.filter(
+        recipe__in=recipe_ids).values_list('ingredient_id', flat=True)
+
+
+def get_cart_user_ids(recipe_id):
+    return ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+
+
+def cart_changed(user_id, recipe_ids):
+    """Рецепты добавлены в список покупок юзера или удалены из него."""
+    schedule_refresh(user_ids=(user_id,), recipe_ids=recipe_ids)
+
+
+def recipe_ingredients_changed(recipe_id, ingredient_ids):
+    """У рецепта добавлены, изменены или удалены ингредиенты."""
+    schedule_refresh(
+        ingredient_ids=ingredient_ids, cart_recipe_ids=(recipe_id,))
+
+
+def shopping_cart_changed(sender, instance, created=True, **kwargs):
+    if created:
+        cart_changed(instance.user_id, (instance.recipe_id,))
+
+
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    recipe_ingredients_changed(instance.recipe_id, (instance.ingredient_id,))
+
+
+def recipe_deleting(sender, instance, **kwargs):
+    # После удаления рецепта его ингредиенты и списки покупок уже не
+    # найти, поэтому затронутые пары собираются до удаления.
+    schedule_refresh(
+        user_ids=get_cart_user_ids(instance.pk),
+        ingredient_ids=get_recipe_ingredient_ids((instance.pk,)))
+
+
+def check_items(batch_size=1000, fix=False):
+    """Сверяет агрегат с полным пересчетом по пачкам пользователей.
+
+    Возвращает id пользователей с расхождениями; при fix их списки
+    пересчитываются заново.
+    """
+    user_ids = sorted(set(
+        ShoppingCart.objects.values_list('user_id', flat=True)) | set(
+        ShoppingListItem.objects.values_list('user_id', flat=True)))
+    broken = []
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        expected = get_totals(batch)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListItem.objects.filter(user__in=batch).values_list(
+                'user_id', 'ingredient_id', 'amount').iterator()}
+        broken.extend(sorted({
+            user_id for (user_id, ingredient_id) in
+            expected.keys() | stored.keys()
+            if expected.get((user_id, ingredient_id)) !=
+            stored.get((user_id, ingredient_id))}))
+    if fix:
+        for user_id in broken:
+            with transaction.atomic():
+                ShoppingListItem.objects.filter(user_id=user_id).delete()
+                ShoppingListItem.objects.bulk_create(
+                    ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=amount)
+                    for (_, ingredient_id), amount in
+                    get_totals((user_id,)).items())
+    return broken
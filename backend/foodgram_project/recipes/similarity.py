@@ -0,0 +1,179 @@
+"""Расчет похожих рецептов по общим ингредиентам и тегам.
+
+Каждый рецепт представляется разреженным вектором (ингредиенты и теги
+с весом IDF), сходство считается как косинус между нормированными
+векторами. Соседи для блоков рецептов считаются векторно в NumPy
+в пуле процессов, результат сохраняется в RecipeNeighbour, а дата
+расчета — в Recipe.neighbours_computed_at, даже если соседей нет.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredientAmount, RecipeNeighbour, RecipeTag
+
+TAG_WEIGHT = 0.5
+
+matrix = None
+
+
+def build_matrix():
+    """Строит нормированную матрицу рецепт x (ингредиенты + теги).
+
+    Возвращает матрицу и массив id рецептов в порядке строк.
+    """
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by('id').values_list('id', flat=True),
+        dtype=np.int64)
+    positions = {recipe_id: row for row, recipe_id in enumerate(recipe_ids)}
+    rows, columns, weights = [], [], []
+    features = {}
+    relations = (
+        (RecipeIngredientAmount, 'ingredient_id', 1.0, 'ingredient'),
+        (RecipeTag, 'tag_id', TAG_WEIGHT, 'tag'))
+    for model, field, weight, prefix in relations:
+        for recipe_id, feature_id in model.objects.values_list(
+                'recipe_id', field).iterator():
+            column = features.setdefault(
+                (prefix, feature_id), len(features))
+            rows.append(positions[recipe_id])
+            columns.append(column)
+            weights.append(weight)
+    result = sparse.csr_matrix(
+        (np.array(weights, dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), len(features)))
+    document_frequency = np.bincount(
+        result.indices, minlength=len(features))
+    idf = np.log((1 + len(recipe_ids)) / (1 + document_frequency)) + 1
+    result = result @ sparse.diags(idf.astype(np.float32))
+    norms = np.sqrt(np.asarray(result.multiply(result).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ result), recipe_ids
+
+
+def init_worker(shared_matrix):
+    global matrix
+    matrix = shared_matrix
+
+
+def compute_chunk(rows, top_k):
+    """Возвращает top_k соседей для строк матрицы rows.
+
+    Произведение остается разреженным: top_k выбирается только среди
+    ненулевых сходств каждой строки.
+    """
+    scores = (matrix[rows] @ matrix.T).tocsr()
+    neighbours, neighbour_scores = [], []
+    for index, row in enumerate(rows):
+        start, end = scores.indptr[index], scores.indptr[index + 1]
+        columns = scores.indices[start:end]
+        values = scores.data[start:end]
+        keep = (columns != row) & (values > 0)
+        columns, values = columns[keep], values[keep]
+        if len(values) > top_k:
+            best = np.argpartition(-values, top_k - 1)[:top_k]
+            columns, values = columns[best], values[best]
+        order = np.argsort(-values)
+        neighbours.append(columns[order])
+        neighbour_scores.append(values[order])
+    return rows, neighbours, neighbour_scores
+
+
+def get_changed_recipes(since):
+    """Рецепты, измененные после since, и рецепты, еще не рассчитанные."""
+    return Recipe.objects.filter(
+        Q(modified_at__gt=since) | Q(neighbours_computed_at__isnull=True))
+
+
+def get_affected_rows(shared_matrix, recipe_ids, changed_rows, top_k,
+                      chunk_size=64):
+    """Строки, в top_k которых может войти один из измененных рецептов.
+
+    Строка пересчитывается, если ее сходство с каким-либо измененным
+    рецептом больше сходства с ее последним сохраненным соседом. Если
+    соседей меньше top_k, достаточно любого ненулевого сходства.
+    """
+    best = np.zeros(shared_matrix.shape[0], dtype=np.float32)
+    transposed = shared_matrix.T.tocsr()
+    for start in range(0, len(changed_rows), chunk_size):
+        scores = shared_matrix[changed_rows[start:start + chunk_size]] @ (
+            transposed)
+        best = np.maximum(best, scores.max(axis=0).toarray().ravel())
+    thresholds = np.zeros(len(recipe_ids), dtype=np.float32)
+    stored = RecipeNeighbour.objects.values('recipe_id').annotate(
+        count=Count('id'), lowest=Min('score')).filter(
+            count__gte=top_k).order_by()
+    stored_ids = np.array(
+        [(item['recipe_id'], item['lowest']) for item in stored.iterator()],
+        dtype=np.float64).reshape(-1, 2)
+    positions = np.searchsorted(recipe_ids, stored_ids[:, 0].astype(np.int64))
+    found = positions < len(recipe_ids)
+    found[found] = recipe_ids[positions[found]] == stored_ids[found, 0]
+    thresholds[positions[found]] = stored_ids[found, 1]
+    return np.flatnonzero(best > thresholds)
+
+
+def save_neighbours(computed_at, recipe_ids, rows, neighbours, scores):
+    targets = recipe_ids[rows].tolist()
+    entries = [
+        RecipeNeighbour(
+            recipe_id=recipe_id, neighbour_id=int(recipe_ids[neighbour]),
+            score=float(score), computed_at=computed_at)
+        for recipe_id, row_neighbours, row_scores in zip(
+            targets, neighbours, scores)
+        for neighbour, score in zip(row_neighbours, row_scores)]
+    with transaction.atomic():
+        RecipeNeighbour.objects.filter(recipe_id__in=targets).delete()
+        RecipeNeighbour.objects.bulk_create(entries)
+        Recipe.objects.filter(pk__in=targets).update(
+            neighbours_computed_at=computed_at)
+    return len(entries)
+
+
+def neighbour_deleting(sender, instance, **kwargs):
+    # Соседи удаляемого рецепта удаляются каскадно, и у ссылавшихся на
+    # него рецептов их становится меньше: такие рецепты пересчитываются.
+    Recipe.objects.filter(neighbours__neighbour=instance).update(
+        neighbours_computed_at=None)
+
+
+def compute_neighbours(top_k=20, chunk_size=256, workers=None, full=False):
+    """Пересчитывает соседей и возвращает число обработанных рецептов.
+
+    Без full пересчитываются только рецепты, измененные с прошлого
+    запуска, рецепты, у которых они были в списке соседей, и рецепты,
+    в чьи top_k они могут войти после изменения.
+    """
+    started_at = timezone.now()
+    last_run = Recipe.objects.aggregate(
+        last_run=Max('neighbours_computed_at'))['last_run']
+    shared_matrix, recipe_ids = build_matrix()
+    if full or last_run is None:
+        rows = np.arange(len(recipe_ids))
+    else:
+        changed = get_changed_recipes(last_run)
+        changed_rows = np.flatnonzero(np.isin(
+            recipe_ids, list(changed.values_list('id', flat=True))))
+        referring_ids = RecipeNeighbour.objects.filter(
+            neighbour__in=changed).values_list('recipe_id', flat=True)
+        rows = np.union1d(
+            np.flatnonzero(np.isin(recipe_ids, list(referring_ids))),
+            get_affected_rows(
+                shared_matrix, recipe_ids, changed_rows, top_k))
+        rows = np.union1d(changed_rows, rows)
+    if not len(rows):
+        return 0
+    chunks = [rows[start:start + chunk_size]
+              for start in range(0, len(rows), chunk_size)]
+    connections.close_all()
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker,
+            initargs=(shared_matrix,)) as executor:
+        for result in executor.map(
+                compute_chunk, chunks, [top_k] * len(chunks)):
+            save_neighbours(started_at, recipe_ids, *result)
+    return len(rows)
@@ -0,0 +1,439 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from users.models import User
+from .bulk import (ADDED, ALREADY_ADDED, NOT_ADDED, REMOVED, bulk_add,
+                   bulk_remove)
+from .images import get_variant_name
+from .models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                     RecipeIngredientAmount, RecipeNeighbour, ShoppingCart,
+                     ShoppingListItem)
+from .search import search_recipes
+from .shopping_list import check_items
+from .similarity import compute_neighbours
+
+
+class CountersSaveTest(TransactionTestCase):
+    """Сохранение объекта не затирает счетчики, измененные параллельно."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=10)
+
+    def test_recipe_save_keeps_favorites_count(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        recipe.name = 'Борщ'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Борщ')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_user_save_keeps_followers_count(self):
+        author = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(follower=self.user, following=self.author)
+        author.set_password('new-password')
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 1)
+
+
+class CountersTest(TransactionTestCase):
+    """Счетчики меняются одним UPDATE на транзакцию и не уходят ниже нуля."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'Суп {index}', text='Текст',
+                cooking_time=10)
+            for index in range(10)]
+        for recipe in self.recipes:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+
+    def test_cascade_delete_updates_counters_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.user.delete()
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE') and
+                   'favorites_count' in query['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Recipe.objects.values_list(
+            'favorites_count', flat=True)), {0})
+
+    def test_rolled_back_changes_are_dropped(self):
+        first, second = self.recipes[:2]
+        with self.assertRaises(ValueError), transaction.atomic():
+            Favorite.objects.create(user=self.author, recipe=first)
+            raise ValueError
+        with transaction.atomic():
+            Favorite.objects.create(user=self.author, recipe=second)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(
+            (first.favorites_count, second.favorites_count), (1, 2))
+
+    def test_decrement_stops_at_zero(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=0)
+        Favorite.objects.get(recipe=recipe).delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+
+class BulkTest(TransactionTestCase):
+    """Массовые операции меняют счетчики ровно на число измененных строк."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        self.recipes = []
+        for amount in (1, 2):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'Суп {amount}', text='Текст',
+                cooking_time=10)
+            RecipeIngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount)
+            self.recipes.append(recipe)
+        bulk_add(ShoppingCart, self.user, [
+            recipe.pk for recipe in self.recipes])
+
+    def test_remove_updates_counters_and_shopping_list(self):
+        first, second = self.recipes
+        results = bulk_remove(ShoppingCart, self.user, [first.pk, 0])
+        self.assertEqual(results, [
+            {'id': first.pk, 'status': REMOVED},
+            {'id': 0, 'status': NOT_ADDED}])
+        self.assertEqual(list(ShoppingCart.objects.values_list(
+            'recipe_id', flat=True)), [second.pk])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(
+            (first.in_carts_count, second.in_carts_count), (0, 1))
+        self.assertEqual(list(ShoppingListItem.objects.values_list(
+            'amount', flat=True)), [2])
+
+    def test_remove_updates_counter_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            bulk_remove(ShoppingCart, self.user, [
+                recipe.pk for recipe in self.recipes])
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE') and
+                   'in_carts_count' in query['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Recipe.objects.values_list(
+            'in_carts_count', flat=True)), {0})
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_add_skips_rows_inserted_concurrently(self):
+        first, second = self.recipes
+        inserted = []
+
+        def add_concurrently(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            # Параллельный запрос добавляет рецепт после того, как
+            # bulk_add прочитал уже добавленные.
+            if (not inserted and sql.startswith('SELECT') and
+                    Favorite._meta.db_table in sql):
+                inserted.append(True)
+                Favorite.objects.bulk_create(
+                    [Favorite(user=self.user, recipe=first)])
+            return result
+
+        with connection.execute_wrapper(add_concurrently):
+            results = bulk_add(Favorite, self.user, [first.pk, second.pk])
+        self.assertEqual(results, [
+            {'id': first.pk, 'status': ALREADY_ADDED},
+            {'id': second.pk, 'status': ADDED}])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(
+            (first.favorites_count, second.favorites_count), (0, 1))
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=False)
+class FeedTest(TransactionTestCase):
+    """Лента подписок обновляется фоновыми задачами после фиксации."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.tasks = []
+        patcher = mock.patch(
+            'recipes.feed.executor.submit', side_effect=self.tasks.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=10)
+        self.run_tasks()
+
+    def run_tasks(self):
+        while self.tasks:
+            self.tasks.pop(0)()
+
+    def get_feed(self, user):
+        return list(FeedEntry.objects.filter(user=user).order_by(
+            '-pub_date', '-id').values_list('recipe__name', flat=True))
+
+    @mock.patch('recipes.feed.FEED_BATCH_SIZE', 2)
+    def test_new_recipe_fans_out_to_all_followers(self):
+        followers = [
+            User.objects.create_user(
+                username=f'follower{index}',
+                email=f'follower{index}@example.com', password='pass')
+            for index in range(5)]
+        for follower in followers:
+            Follow.objects.create(follower=follower, following=self.author)
+        self.run_tasks()
+        Recipe.objects.create(
+            author=self.author, name='Каша', text='Текст', cooking_time=10)
+        self.assertEqual(self.get_feed(followers[0]), ['Суп'])
+        self.run_tasks()
+        for follower in followers:
+            self.assertEqual(self.get_feed(follower), ['Каша', 'Суп'])
+        self.assertEqual(self.get_feed(self.user), [])
+
+    def test_unfollow_clears_feed(self):
+        follow = Follow.objects.create(
+            follower=self.user, following=self.author)
+        self.run_tasks()
+        self.assertEqual(self.get_feed(self.user), ['Суп'])
+        follow.delete()
+        self.assertEqual(self.get_feed(self.user), [])
+
+    def test_backfill_after_unfollow_adds_nothing(self):
+        follow = Follow.objects.create(
+            follower=self.user, following=self.author)
+        follow.delete()
+        self.run_tasks()
+        self.assertFalse(FeedEntry.objects.exists())
+
+
+class ShoppingListTest(TransactionTestCase):
+    """Агрегированный список покупок следует за корзиной и рецептами."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        self.salt, self.milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'молоко'))
+        self.porridge = self.create_recipe(
+            'Каша', ((self.salt, 5), (self.milk, 200)))
+        self.omelette = self.create_recipe('Омлет', ((self.salt, 2),))
+
+    def create_recipe(self, name, amounts):
+        recipe = Recipe.objects.create(
+            author=self.user, name=name, text='Текст', cooking_time=10)
+        for ingredient, amount in amounts:
+            RecipeIngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount)
+        return recipe
+
+    def get_items(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient__name', 'amount'))
+
+    def test_cart_changes(self):
+        bulk_add(ShoppingCart, self.user,
+                 [self.porridge.pk, self.omelette.pk])
+        self.assertEqual(self.get_items(), {'соль': 7, 'молоко': 200})
+        ShoppingCart.objects.get(recipe=self.porridge).delete()
+        self.assertEqual(self.get_items(), {'соль': 2})
+        bulk_remove(ShoppingCart, self.user, [self.omelette.pk])
+        self.assertEqual(self.get_items(), {})
+
+    def test_recipe_changes(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        ShoppingCart.objects.create(user=self.user, recipe=self.omelette)
+        row = RecipeIngredientAmount.objects.get(
+            recipe=self.omelette, ingredient=self.salt)
+        row.amount = 10
+        row.save()
+        self.assertEqual(self.get_items(), {'соль': 15, 'молоко': 200})
+        RecipeIngredientAmount.objects.create(
+            recipe=self.omelette, ingredient=self.milk, amount=50)
+        self.assertEqual(self.get_items(), {'соль': 15, 'молоко': 250})
+        self.porridge.delete()
+        self.assertEqual(self.get_items(), {'соль': 10, 'молоко': 50})
+
+    def test_check_items(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        self.assertEqual(check_items(), [])
+        ShoppingListItem.objects.filter(ingredient=self.salt).update(
+            amount=1)
+        self.assertEqual(check_items(fix=True), [self.user.pk])
+        self.assertEqual(self.get_items(), {'соль': 5, 'молоко': 200})
+        self.assertEqual(check_items(), [])
+
+
+class SimilarityTest(TransactionTestCase):
+    """Инкрементальный расчет пересчитывает только затронутые рецепты."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.salt, pepper, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'перец', 'сахар'))
+        self.recipes = {}
+        self.create_recipe('Суп', self.salt, pepper)
+        self.create_recipe('Рагу', self.salt, pepper)
+        self.create_recipe('Компот', sugar)
+
+    def create_recipe(self, name, *ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text='Текст', cooking_time=10)
+        for ingredient in ingredients:
+            RecipeIngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1)
+        self.recipes[name] = recipe
+
+    def get_neighbours(self, name):
+        return list(RecipeNeighbour.objects.filter(
+            recipe=self.recipes[name]).order_by('-score').values_list(
+                'neighbour__name', flat=True))
+
+    def test_recipe_without_neighbours_is_computed_once(self):
+        self.assertEqual(compute_neighbours(workers=1), 3)
+        self.assertEqual(self.get_neighbours('Суп'), ['Рагу'])
+        self.assertEqual(self.get_neighbours('Компот'), [])
+        self.assertFalse(Recipe.objects.filter(
+            neighbours_computed_at__isnull=True).exists())
+        self.assertEqual(compute_neighbours(workers=1), 0)
+
+    def test_deleted_neighbour_marks_referring_recipes(self):
+        compute_neighbours(workers=1)
+        self.recipes['Рагу'].delete()
+        self.assertEqual(compute_neighbours(workers=1), 1)
+        self.assertEqual(self.get_neighbours('Суп'), [])
+        self.assertEqual(compute_neighbours(workers=1), 0)
+
+    def test_top_k_keeps_best_neighbours(self):
+        self.create_recipe('Соус', self.salt)
+        compute_neighbours(top_k=1, workers=1)
+        self.assertEqual(self.get_neighbours('Рагу'), ['Суп'])
+        compute_neighbours(top_k=2, workers=1, full=True)
+        self.assertEqual(self.get_neighbours('Рагу'), ['Суп', 'Соус'])
+
+
+class ImageProcessingTest(TransactionTestCase):
+    """Варианты изображения создаются после сохранения рецепта."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=10,
+            image='recipes/soup.png')
+
+    def test_variants_created(self):
+        os.makedirs(os.path.join(self.media_root, 'recipes'))
+        Image.new('RGB', (2000, 1000)).save(
+            os.path.join(self.media_root, 'recipes', 'soup.png'))
+        recipe = self.create_recipe()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.processed_image, 'recipes/soup.png')
+        thumbnail = os.path.join(self.media_root, get_variant_name(
+            'recipes/soup.png', 'thumbnail', 'webp'))
+        with Image.open(thumbnail) as image:
+            self.assertEqual(image.size, (400, 200))
+
+    def test_missing_source_is_logged(self):
+        with self.assertLogs('recipes.images', 'WARNING') as logs:
+            recipe = self.create_recipe()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsNone(logs.records[0].exc_info)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.processed_image, '')
+
+
+class SearchTest(TransactionTestCase):
+    """Поиск находит рецепты по названию и описанию и ранжирует их."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        for name, text in (('Борщ', 'Свекла, капуста и мясо'),
+                           ('Щи', 'Капуста, морковь, подается со сметаной'),
+                           ('Компот', 'Яблоки и сахар')):
+            self.create_recipe(name, text)
+
+    def create_recipe(self, name, text):
+        return Recipe.objects.create(
+            author=self.author, name=name, text=text, cooking_time=10)
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.all(), query).values_list(
+            'name', flat=True))
+
+    def test_name_ranks_above_text(self):
+        self.create_recipe('Капуста', 'Тушеная')
+        self.assertEqual(self.search('капуста')[0], 'Капуста')
+        self.assertEqual(
+            sorted(self.search('капуста')[1:]), ['Борщ', 'Щи'])
+
+    def test_edited_and_deleted_recipes(self):
+        recipe = Recipe.objects.get(name='Компот')
+        recipe.text = 'Вишня и сахар'
+        recipe.save()
+        self.assertEqual(self.search('яблоки'), [])
+        self.assertEqual(self.search('вишня'), ['Компот'])
+        recipe.delete()
+        self.assertEqual(self.search('вишня'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_russian_morphology(self):
+        self.assertEqual(self.search('сметана'), ['Щи'])
+        self.assertEqual(self.search('борща'), ['Борщ'])
+
+
+class SeedBenchmarkDataTest(TransactionTestCase):
+    """Сгенерированные данные согласованы, изображение в MEDIA_ROOT."""
+
+    def test_seed(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        call_command(
+            'seed_benchmark_data', users=5, recipes=10, follows=2,
+            favorites=3, cart=2, min_ingredients=1, max_ingredients=1,
+            stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Recipe.objects.count(), 10)
+        self.assertTrue(os.path.isfile(os.path.join(
+            settings.MEDIA_ROOT, Recipe.objects.first().image.name)))
+        for user in User.objects.all():
+            self.assertEqual(user.recipes_count, user.recipes.count())
+            self.assertEqual(user.followers_count, user.followers.count())
+        self.assertEqual(
+            FeedEntry.objects.count(),
+            sum(Recipe.objects.filter(author=follow.following).count()
+                for follow in Follow.objects.all()))
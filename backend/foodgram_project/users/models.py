@@ -6,7 +6,30 @@ ADMIN = 'admin'
 ROLE_CHOICES = [(USER, 'user'), (ADMIN, 'admin')]
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Сохранение объекта не перезаписывает его счетчики.
+
+    Счетчики меняются только атомарными UPDATE с F(), а значения
+    в загруженном объекте могут устареть. Поэтому при обновлении без
+    явного update_fields сохраняются все поля, кроме счетчиков.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and self.pk is not None and
+                not kwargs.get('force_insert') and
+                kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.counter_fields and
+                field.attname not in deferred]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Модель пользователя."""
 
     first_name = models.CharField('имя', max_length=150)
@@ -15,7 +38,12 @@ class User(AbstractUser):
     role = models.CharField(
         verbose_name='роль',
         default=USER, choices=ROLE_CHOICES, max_length=20)
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='подписчиков', default=0, editable=False)
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name']
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'